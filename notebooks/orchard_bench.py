@@ -0,0 +1,254 @@
+# benchmarks of the orchard simulation
+# run the whole suite from the notebooks folder with: python orchard_bench.py
+# the results are saved as JSON (bench_results.json by default), and can be compared with the results of an
+# earlier run to catch regressions: python orchard_bench.py new_results.json --compare bench_results.json
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import TreeStore
+from orchardproject import AppleTree
+from orchardproject import PearTree
+from orchardproject import PlumTree
+import orchard_render
+
+
+
+# reference implementation: the original character by character rewriting of Tree.ith_iteration
+
+def legacy_ith_iteration(start, rules):
+    """This function computes one iteration of an L-system the way Tree.ith_iteration originally did,
+    concatenating the output of each character's rule one at a time"""
+    end = ""
+    for c in start:
+        end += rules[c]
+    return end
+
+
+def legacy_tree_string(axiom, rules, years):
+    """This function generates the string of a tree at a specified time (years) with legacy_ith_iteration"""
+    if years == 0:
+        return axiom
+    newstring = rules[axiom]
+    for year in range(1, years):
+        newstring = legacy_ith_iteration(newstring, rules)
+    return newstring
+
+
+def best_time(function, *args, repeat=3):
+    """This function returns the best wall-clock time, in seconds, of repeat calls of function(*args)"""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(function, *args, repeat=3, setup=None):
+    """This function runs function(*args) repeat times, calling setup() (e.g. to empty a cache) before each run.
+    It returns the best wall-clock time in seconds and the peak memory allocated during one run in bytes
+    (traced by tracemalloc in a separate, untimed run, since tracing slows everything down)"""
+    timings = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+
+# benchmark of the string rewriting engine
+
+def bench_rewriting(years=range(10, 15), repeat=3):
+    """This function times the generation of one tree string for each species and year, with the original rewriting
+    loop and with the compiled rules of the species' Grammar. The expansion cache is emptied before each compiled run,
+    so both engines derive the string from the axiom.
+    It returns a list of dictionaries: species, year, string length, legacy and compiled time and speedup"""
+
+    results = []
+    for species in (AppleTree, PearTree, PlumTree):
+        rules = dict(species.grammar.rules)
+
+        def compiled_tree_string(year):
+            Tree.clear_expansion_cache()
+            return Tree.grammar_string(species.grammar, year)
+
+        for year in years:
+            legacy = best_time(legacy_tree_string, species.axiom, rules, year, repeat=repeat)
+            compiled = best_time(compiled_tree_string, year, repeat=repeat)
+            results.append({"species": species.__name__,
+                            "year": year,
+                            "length": len(compiled_tree_string(year)),
+                            "legacy_s": legacy,
+                            "compiled_s": compiled,
+                            "speedup": legacy / compiled})
+    Tree.clear_expansion_cache()
+    return results
+
+
+# benchmarks of the simulation paths: one list of result rows per benchmark, all with "seconds" and "peak_bytes"
+
+def bench_tree_string(years=range(0, 15), repeat=3):
+    """This function times Tree.tree_string for the rules of each species at each year, from an empty expansion cache"""
+    results = []
+    for species in (AppleTree, PearTree, PlumTree):
+        for year in years:
+            seconds, peak = measure(Tree.tree_string, species.axiom, species.constants, species.variables, species.rules, year,
+                                    repeat=repeat, setup=Tree.clear_expansion_cache)
+            results.append({"species": species.__name__, "year": year, "seconds": seconds, "peak_bytes": peak})
+    Tree.clear_expansion_cache()
+    return results
+
+
+def bench_per_year(years=range(0, 15), n_calls=1000, repeat=3):
+    """This function times n_calls calls of the *_per_year function of each species for each year, counting the
+    branches from the rules (symbol_counts) as generate_trees does, and from the tree string (count_branches)"""
+    results = []
+    for species, per_year in ((AppleTree, AppleTree.apples_per_year), (PearTree, PearTree.pears_per_year), (PlumTree, PlumTree.plums_per_year)):
+        for year in years:
+            t_string = Tree.grammar_string(species.grammar, year)
+            for counting, argument in (("symbol_counts", None), ("count_branches", t_string)):
+                seconds, peak = measure(lambda: [per_year(year, argument) for i in range(n_calls)], repeat=repeat)
+                results.append({"species": species.__name__, "year": year, "counting": counting, "calls": n_calls,
+                                "seconds": seconds, "peak_bytes": peak})
+    return results
+
+
+def bench_species_harvest(orchard_sizes=(5, 50, 500, 5000), seed=2022, repeat=3):
+    """This function times Tree.species_harvest of each species, for orchards of increasing size (in acres)"""
+    results = []
+    for orchard_size in orchard_sizes:
+        bench_orchard = Orchard(orchard_size, seed=seed)
+        for species in TreeStore.species_names:
+            seconds, peak = measure(Tree.species_harvest, species, None, bench_orchard, repeat=repeat)
+            results.append({"species": species, "orchard_size": orchard_size, "trees": bench_orchard.tree_counts[species],
+                            "seconds": seconds, "peak_bytes": peak})
+    return results
+
+
+def bench_rendering(years=(6, 8, 10), n_trees=10, repeat=3, seed=2022):
+    """This function times the headless drawing of the trees of each species (see orchard_render) at a few ages:
+    interpreting the string into a skeleton (cold cache), placing n_trees trees on it, and rasterizing them"""
+    results = []
+    for species in (AppleTree, PearTree, PlumTree):
+        for year in years:
+            skeleton_s, skeleton_peak = measure(orchard_render.tree_skeleton, species, year, 30, repeat=repeat,
+                                                setup=orchard_render.clear_skeleton_cache)
+            skeleton = orchard_render.tree_skeleton(species, year, 30)
+            rng = np.random.default_rng(seed)
+            place = lambda: [orchard_render.tree_geometry(species, skeleton, (0, 0), rng) for i in range(n_trees)]
+            geometry_s, geometry_peak = measure(place, repeat=repeat)
+            groups = []
+            for geometry in place():
+                groups.extend(orchard_render.geometry_groups(species, geometry))
+            raster_s, raster_peak = measure(orchard_render.rasterize, groups, repeat=repeat)
+            results.append({"species": species.__name__, "year": year, "segments": len(skeleton), "trees": n_trees,
+                            "skeleton_s": skeleton_s, "geometry_s": geometry_s, "rasterize_s": raster_s,
+                            "seconds": skeleton_s + geometry_s + raster_s,
+                            "peak_bytes": max(skeleton_peak, geometry_peak, raster_peak)})
+    orchard_render.clear_skeleton_cache()
+    return results
+
+
+def run_suite(repeat=3):
+    """This function runs every benchmark of the suite.
+    It returns a dictionary with the run's environment ("meta") and the result rows of each benchmark ("benchmarks")"""
+    return {"meta": {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "python": platform.python_version(),
+                     "numpy": np.__version__,
+                     "machine": platform.machine(),
+                     "repeat": repeat},
+            "benchmarks": {"tree_string": bench_tree_string(repeat=repeat),
+                           "per_year": bench_per_year(repeat=repeat),
+                           "species_harvest": bench_species_harvest(repeat=repeat),
+                           "rendering": bench_rendering(repeat=repeat),
+                           "rewriting": bench_rewriting(repeat=repeat)}}
+
+
+def save_results(suite, path):
+    """This function saves the results of a run of the suite (see run_suite) to a JSON file"""
+    with open(path, "w") as results_file:
+        json.dump(suite, results_file, indent=1)
+
+
+def load_results(path):
+    """This function loads the results of a run of the suite saved with save_results"""
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare_results(baseline, suite, tolerance=0.25, min_seconds=0.001):
+    """This function compares the timings of a run of the suite with the ones of a baseline run, row by row.
+    tolerance: the relative slowdown above which a row counts as a regression
+    min_seconds: rows faster than this in both runs are ignored, since their timings are mostly noise
+    It returns the list of regressions: benchmark, row parameters, baseline and new seconds and their ratio"""
+    regressions = []
+    for name, rows in suite["benchmarks"].items():
+        # rows are matched on all their non-measured entries (species, year, ...)
+        keys = lambda row: tuple((k, v) for k, v in row.items() if not isinstance(v, float) and k != "peak_bytes")
+        baseline_rows = {keys(row): row for row in baseline["benchmarks"].get(name, [])}
+        for row in rows:
+            old = baseline_rows.get(keys(row))
+            time_key = "seconds" if "seconds" in row else "compiled_s"
+            if old is None or max(old[time_key], row[time_key]) < min_seconds:
+                continue
+            if row[time_key] > old[time_key] * (1 + tolerance):
+                regressions.append({"benchmark": name, "row": dict(keys(row)), "baseline_s": old[time_key],
+                                    "seconds": row[time_key], "ratio": row[time_key] / old[time_key]})
+    return regressions
+
+
+def print_results(results):
+    """This function prints benchmark results as a table"""
+    columns = list(results[0])
+    print("  ".join(column.rjust(12) for column in columns))
+    for row in results:
+        cells = []
+        for column in columns:
+            if isinstance(row[column], float):
+                cells.append(format(row[column], ".4f").rjust(12))
+            else:
+                cells.append(str(row[column]).rjust(12))
+        print("  ".join(cells))
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks of the orchard simulation")
+    parser.add_argument("output", nargs="?", default="bench_results.json", help="JSON file where the results are saved")
+    parser.add_argument("--compare", help="JSON file of an earlier run, to report the regressions against")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each benchmark (the best one is kept)")
+    arguments = parser.parse_args()
+
+    suite = run_suite(arguments.repeat)
+    for name, rows in suite["benchmarks"].items():
+        print(name)
+        print_results(rows)
+        print()
+    save_results(suite, arguments.output)
+    print("results saved to", arguments.output)
+
+    if arguments.compare is not None:
+        regressions = compare_results(load_results(arguments.compare), suite)
+        if regressions:
+            print(len(regressions), "regressions against", arguments.compare)
+            for regression in regressions:
+                print(regression)
+        else:
+            print("no regressions against", arguments.compare)
@@ -0,0 +1,213 @@
+# a persistent, content-addressed cache of simulation outputs on disk (harvest matrices, tree strings, tree skeletons)
+# every output is stored in a file named by a stable hash of everything it depends on (grammar, orchard parameters,
+# species thresholds, horizon, seed), so identical runs, e.g. re-running a notebook, only read the file back.
+# Files are written atomically (written aside, then renamed), so several processes can share one cache directory.
+# To make species_harvest read and write the cache: orchard_cache.enable("some/directory")
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from orchardproject import Tree
+import orchard_render
+
+
+
+# the version of the cached formats and of the computations behind them: changing it invalidates all cached files
+cache_version = 2
+
+
+def stable_hash(*parts):
+    """This function returns a hash (hexadecimal sha256) of JSON-like parts, which is the same in every process and
+    every run (unlike python's hash): dictionaries are hashed with sorted keys, tuples like lists"""
+    text = json.dumps([cache_version, parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def grammar_description(grammar):
+    """This function describes a Grammar for hashing: its axiom and (sorted) rules"""
+    return {"axiom": grammar.axiom, "rules": grammar.frozen_rules}
+
+
+def harvest_description(species_class, tot_n_trees, orchard=None):
+    """This function describes everything a harvest matrix depends on (see Tree.harvest_matrix), for hashing:
+    the species' grammar, thresholds and harvest range, the orchard's parameters, plantings and seed, the number of trees
+    and the horizon (time line)"""
+    if orchard is None:
+        maturation_threshold = species_class.maturation_threshold
+        orchard = Tree.default_orchard()
+    else:
+        maturation_threshold = orchard.maturation_thresholds[species_class.__name__]
+    return {"species": species_class.__name__,
+            "grammar": grammar_description(species_class.grammar),
+            "maturation_threshold": maturation_threshold,
+            "disease_threshold": species_class.disease_threshold,
+            "disease_severity": species_class.disease_severity,
+            "harvest_range": species_class.harvest_range,
+            "orchard_size": orchard.orchard_size,
+            "growth_probabilities": orchard.growth_probabilities,
+            "plantings": orchard.plantings[species_class.__name__],
+            "seed": orchard.seed,
+            "n_trees": tot_n_trees,
+            "horizon": len(Tree.time_line)}
+
+
+class DiskCache():
+    """A directory of cached outputs, each one in a file named by its key (see stable_hash).
+    max_bytes: the total size of the files kept; beyond it, the least recently used files are removed
+    max_age: files not used for longer than this (in seconds) are removed, None to keep them whatever their age"""
+
+    def __init__(self, directory="orchard_cache", max_bytes=2**30, max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        os.makedirs(directory, exist_ok=True)
+
+
+    def path(self, key, suffix):
+        """This function returns the path of the file of a key; files are spread over 256 sub-directories"""
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+
+    def read(self, key, suffix, load):
+        """This function loads the file of a key with load(path), or returns None if it is not in the cache.
+        Reading a file marks it as recently used"""
+        path = self.path(key, suffix)
+        try:
+            value = load(path)
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+
+    def write(self, key, suffix, save):
+        """This function writes the file of a key with save(file), atomically: the file is written under a temporary
+        name in the same directory and renamed when complete, so readers never see a partial file, and of two processes
+        writing the same key the last rename wins (with identical contents)"""
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=suffix)
+        try:
+            with os.fdopen(handle, "wb") as cache_file:
+                save(cache_file)
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.evict()
+
+
+    def evict(self):
+        """This function removes the files older than max_age, then the least recently used files until the cache
+        holds at most max_bytes. Files removed meanwhile by another process are skipped"""
+        files = []
+        for root, directories, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                try:
+                    status = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                files.append((status.st_mtime, status.st_size, os.path.join(root, name)))
+        files.sort()
+
+        total = sum(size for mtime, size, path in files)
+        now = time.time()
+        for mtime, size, path in files:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            if not too_old and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats["evicted"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+    def clear(self):
+        """This function removes every file of the cache, except the files still being written (by any process)"""
+        for root, directories, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                try:
+                    os.remove(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+
+
+    def size(self):
+        """This function returns the total size of the cached files, in bytes"""
+        return sum(os.path.getsize(os.path.join(root, name)) for root, directories, names in os.walk(self.directory) for name in names)
+
+
+    def harvest_matrix(self, species_class, tot_n_trees, orchard=None):
+        """This function returns the harvest matrix of a species (see Tree.harvest_matrix, with counter-based draws),
+        read from the cache, or computed and then cached"""
+        key = stable_hash("harvest", harvest_description(species_class, tot_n_trees, orchard))
+        harvest = self.read(key, ".npy", np.load)
+        if harvest is None:
+            harvest = Tree.harvest_matrix(species_class, tot_n_trees, orchard=orchard)
+            self.write(key, ".npy", lambda cache_file: np.save(cache_file, harvest))
+        return harvest
+
+
+    def tree_string(self, grammar, years):
+        """This function returns the tree string of a Grammar at a specified time (years), see Tree.grammar_string,
+        read from the cache, or computed and then cached"""
+        key = stable_hash("string", grammar_description(grammar), years)
+
+        def load(path):
+            with open(path, "rb") as cache_file:
+                return cache_file.read().decode("ascii")
+
+        t_string = self.read(key, ".txt", load)
+        if t_string is None:
+            t_string = Tree.grammar_string(grammar, years)
+            self.write(key, ".txt", lambda cache_file: cache_file.write(t_string.encode("ascii")))
+        return t_string
+
+
+    def tree_skeleton(self, species_class, years, form):
+        """This function returns the skeleton of the trees of a species at a given age and form (see
+        orchard_render.tree_skeleton), read from the cache, or computed and then cached"""
+        key = stable_hash("skeleton", grammar_description(species_class.grammar), years, form)
+        fields = ("segments", "directions", "closes", "depths", "is_tip")
+
+        def load(path):
+            with np.load(path) as arrays:
+                return orchard_render.TreeSkeleton(int(arrays["n"]), *(arrays[field] for field in fields))
+
+        skeleton = self.read(key, ".npz", load)
+        if skeleton is None:
+            skeleton = orchard_render.tree_skeleton(species_class, years, form)
+            arrays = {field: getattr(skeleton, field) for field in fields}
+            self.write(key, ".npz", lambda cache_file: np.savez(cache_file, n=skeleton.n, **arrays))
+        return skeleton
+
+
+def enable(directory="orchard_cache", max_bytes=2**30, max_age=None):
+    """This function makes species_harvest read its harvest matrices from a disk cache (and write them to it),
+    see Tree.result_cache. It returns the cache"""
+    Tree.result_cache = DiskCache(directory, max_bytes, max_age)
+    return Tree.result_cache
+
+
+def disable():
+    """This function stops species_harvest from using the disk cache"""
+    Tree.result_cache = None
@@ -0,0 +1,176 @@
+# Monte Carlo ensembles of whole-orchard simulations, and sweeps over a grid of parameters, run in parallel over a pool of processes
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import TreeStore
+
+
+
+def run_sharded(function, items, arguments=(), processes=None):
+    """This function calls function(shard, *arguments) on consecutive shards of a list of items, over a pool of processes,
+    and returns the results of the shards, in order.
+    processes: the number of worker processes, by default one per CPU; with 1 (or fewer than 2 items), function is
+    called once on all items, in this process"""
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(items) < 2:
+        return [function(items, *arguments)]
+
+    # a few shards per process balance the load, while keeping the number of (pickled) results small
+    n_shards = min(len(items), 4 * processes)
+    bounds = np.linspace(0, len(items), n_shards + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(function, items[bounds[i]:bounds[i + 1]], *arguments) for i in range(n_shards)]
+        return [future.result() for future in futures]
+
+
+def replicate_seeds(n_replicates, seed=None):
+    """This function derives one independent seed per replicate from a single ensemble seed, with numpy's SeedSequence.
+    The same ensemble seed always gives the same replicate seeds, whatever the number of processes used"""
+    children = np.random.SeedSequence(seed).spawn(n_replicates)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+
+def run_replicates(seeds, orchard_size=5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7):
+    """This function simulates one orchard per seed, and harvests all its species over the orchard's timeline.
+    It returns compact arrays: the number of trees of each species (one entry per replicate) and the yearly total
+    harvest of each species (one row per replicate, one column per year)"""
+
+    tree_counts = {species: np.zeros(len(seeds), dtype=np.int64) for species in TreeStore.species_names}
+    yearly_totals = {species: np.zeros((len(seeds), len(Tree.time_line)), dtype=np.int64) for species in TreeStore.species_names}
+
+    for i, seed in enumerate(seeds):
+        replicate = Orchard(orchard_size, gprob_apple, gprob_pear, gprob_plum, seed=seed)
+        for species in TreeStore.species_names:
+            harvest = Tree.harvest_matrix(Tree.species_class(species), replicate.tree_counts[species], orchard=replicate)
+            tree_counts[species][i] = replicate.tree_counts[species]
+            yearly_totals[species][i] = harvest.sum(axis=0)
+
+    return tree_counts, yearly_totals
+
+
+def run_ensemble(n_replicates, seed=None, processes=None, orchard_size=5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7):
+    """This function runs n_replicates independent orchard simulations (orchard plus species_harvest of all species),
+    sharded over a pool of processes. Each replicate gets its own seed (see replicate_seeds), so results are
+    reproducible and do not depend on the number of processes.
+    processes: the number of worker processes, by default one per CPU; with 1, everything runs in this process
+    It returns a dictionary with the replicate seeds, and for each species the tree counts and yearly totals arrays
+    (see run_replicates), in replicate order"""
+
+    seeds = replicate_seeds(n_replicates, seed)
+    shards = run_sharded(run_replicates, seeds, (orchard_size, gprob_apple, gprob_pear, gprob_plum), processes)
+
+    results = {"seeds": np.array(seeds, dtype=np.uint64), "tree_counts": {}, "yearly_totals": {}}
+    for species in TreeStore.species_names:
+        results["tree_counts"][species] = np.concatenate([shard[0][species] for shard in shards])
+        results["yearly_totals"][species] = np.concatenate([shard[1][species] for shard in shards])
+    return results
+
+
+def summarize(results, percentiles=(5, 50, 95)):
+    """This function aggregates the yearly totals of an ensemble (see run_ensemble) into statistics across replicates.
+    It returns, for each species, a dictionary of arrays with one entry per year: mean, std, and the given percentiles"""
+    summary = {}
+    for species, yearly_totals in results["yearly_totals"].items():
+        summary[species] = {"mean": yearly_totals.mean(axis=0), "std": yearly_totals.std(axis=0)}
+        for q, values in zip(percentiles, np.percentile(yearly_totals, percentiles, axis=0)):
+            summary[species]["p" + str(q)] = values
+    return summary
+
+
+
+# parameter sweeps: the same orchard (seed) simulated for every point of a grid of parameters
+
+# the parameters of a sweep: the ones of the orchard, and the ones of the species, which can be given for all species
+# (e.g. "disease_severity") or for one species only (e.g. "PlumTree.disease_severity")
+orchard_parameters = ("orchard_size", "gprob_apple", "gprob_pear", "gprob_plum")
+species_parameters = ("disease_severity", "disease_threshold", "maturation_range")
+
+
+def parameter_grid(grid):
+    """This function expands a grid {parameter: list of values} into the list of its points, one dictionary
+    {parameter: value} for each combination of values"""
+    for parameter in grid:
+        if parameter not in orchard_parameters and parameter.split(".")[-1] not in species_parameters:
+            raise ValueError("unknown sweep parameter: " + parameter)
+        if "." in parameter and parameter.split(".")[0] not in TreeStore.species_names:
+            raise ValueError("unknown species in sweep parameter: " + parameter)
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def species_value(point, species, parameter):
+    """This function returns the value of a species parameter at a point of the grid: the one given for the species,
+    else the one given for all species, else the species' class attribute"""
+    return point.get(species + "." + parameter, point.get(parameter, getattr(Tree.species_class(species), parameter)))
+
+
+def sweep_symbol_counts(years):
+    """This function counts, once for the whole sweep, the symbols of the string of every species at every age: they only
+    depend on the species' grammar, not on any parameter of the sweep (see Tree.grammar_counts).
+    It returns them as entries of Tree.count_cache, {(grammar, year): symbol counts}"""
+    return {(Tree.species_class(species).grammar, int(year_n)): Tree.grammar_counts(Tree.species_class(species).grammar, int(year_n))
+            for species in TreeStore.species_names for year_n in years}
+
+
+def run_points(points, symbol_counts, seed):
+    """This function simulates the orchard of the given seed at each point of a sweep, and harvests all its species
+    with Tree.harvest_matrix, with the maturation and disease parameters of the point instead of the class attributes.
+    symbol_counts: the symbol counts computed once for the sweep (see sweep_symbol_counts), so that no process counts them again
+    It returns, for each point, a list of rows: species, number of trees, and the total harvest of each year"""
+
+    Tree.count_cache.update(symbol_counts)
+    results = []
+    for point in points:
+        orchard_arguments = {parameter: point[parameter] for parameter in orchard_parameters if parameter in point}
+        maturation_ranges = {species: species_value(point, species, "maturation_range") for species in TreeStore.species_names}
+        point_orchard = Orchard(seed=seed, maturation_ranges=maturation_ranges, **orchard_arguments)
+
+        rows = []
+        for species in TreeStore.species_names:
+            n_trees = point_orchard.tree_counts[species]
+            overrides = {parameter: species_value(point, species, parameter) for parameter in ("disease_threshold", "disease_severity")}
+            harvest = Tree.harvest_matrix(Tree.species_class(species), n_trees, orchard=point_orchard, overrides=overrides)
+            rows.append((species, n_trees, harvest.sum(axis=0)))
+        results.append(rows)
+    return results
+
+
+def run_sweep(grid, seed=2022, processes=None):
+    """This function runs a parameter sweep: the orchard of the given seed is simulated (orchard plus species_harvest of
+    all species) at every point of the grid, in parallel over a pool of processes, without changing any class attribute.
+    grid: {parameter: list of values}, see orchard_parameters and species_parameters, e.g.
+    {"gprob_apple": [0.5, 0.7, 0.9], "PlumTree.disease_severity": [3, 5, 7], "maturation_range": [(3, 4), (4, 6)]}
+    Symbol (branch) counts do not depend on any of these parameters, so they are computed once, and every point only
+    costs its harvest draws. All points share the seed, so they differ by their parameters only.
+    processes: the number of worker processes, by default one per CPU; with 1, everything runs in this process
+    It returns a tidy dataframe, with one row per point, species and year: the point's number and parameter values,
+    species, year, number of trees, total harvest and mean harvest per tree"""
+
+    points = parameter_grid(grid)
+    symbol_counts = sweep_symbol_counts(range(len(Tree.time_line)))
+    shards = run_sharded(run_points, points, (symbol_counts, seed), processes)
+    results = [rows for shard in shards for rows in shard]
+
+    table = {"point": [], "species": [], "year": [], "n_trees": [], "harvest": []}
+    for parameter in grid:
+        table[parameter] = []
+    for point_n, (point, rows) in enumerate(zip(points, results)):
+        for species, n_trees, totals in rows:
+            for year_n, total in enumerate(totals):
+                table["point"].append(point_n)
+                for parameter, value in point.items():
+                    table[parameter].append(value)
+                table["species"].append(species)
+                table["year"].append(year_n)
+                table["n_trees"].append(n_trees)
+                table["harvest"].append(int(total))
+
+    sweep_df = pd.DataFrame(table, columns=["point"] + list(grid) + ["species", "year", "n_trees", "harvest"])
+    sweep_df["mean_harvest"] = sweep_df["harvest"] / sweep_df["n_trees"].where(sweep_df["n_trees"] > 0)
+    return sweep_df
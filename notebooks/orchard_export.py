@@ -0,0 +1,159 @@
+# export of harvest matrices to columnar files, written chunk by chunk of trees (see Tree.iter_harvest)
+# Parquet and Feather files need pyarrow; .npy files (read back as memory maps) only need numpy
+import json
+
+import numpy as np
+import pandas as pd
+
+from orchardproject import Tree
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+
+def harvest_format(path):
+    """This function returns the export format matching the suffix of a path: "parquet", "feather" or, by default, "npy"."""
+    if path.endswith(".parquet"):
+        return "parquet"
+    elif path.endswith(".feather") or path.endswith(".arrow"):
+        return "feather"
+    else:
+        return "npy"
+
+
+def harvest_metadata(species, orchard=None, tot_n_trees=None):
+    """This function collects the metadata recorded with an exported harvest: species, seed, orchard and species
+    parameters, and the columns of the matrix"""
+    species_class = Tree.species_class(species)
+    if orchard is None:
+        orchard = Tree.default_orchard()
+        maturation_threshold = species_class.maturation_threshold
+    else:
+        maturation_threshold = orchard.maturation_thresholds[species_class.__name__]
+    if tot_n_trees is None:
+        tot_n_trees = Tree.species_tree_count(species, orchard)
+
+    return {"species": species_class.__name__,
+            "seed": orchard.seed,
+            "orchard_size": orchard.orchard_size,
+            "growth_probabilities": orchard.growth_probabilities,
+            "n_trees": tot_n_trees,
+            "maturation_threshold": maturation_threshold,
+            "disease_threshold": species_class.disease_threshold,
+            "disease_severity": species_class.disease_severity,
+            "harvest_range": list(species_class.harvest_range),
+            "axiom": species_class.axiom,
+            "rules": dict(species_class.grammar.rules),
+            "columns": [Tree.iterate_years(year_n) for year_n in range(len(Tree.time_line))] + ["Total"]}
+
+
+def export_harvest(species, path, orchard=None, chunk_size=100000, tot_n_trees=None, file_format=None):
+    """This function writes the harvest matrix of a species (one row per tree, one column per year, plus 'Total', as in
+    species_harvest) to a columnar file, chunk by chunk of trees, so that the whole matrix is never in memory.
+    file_format: "parquet" (one row group per chunk), "feather" (one record batch per chunk) or "npy" (a memory mapped
+    .npy file, with the metadata in a .json file next to it); by default it follows the suffix of path.
+    The species, seed and parameters of the run are recorded with the data (see harvest_metadata).
+    It returns the metadata"""
+
+    if file_format is None:
+        file_format = harvest_format(path)
+    metadata = harvest_metadata(species, orchard, tot_n_trees)
+    n_trees = metadata["n_trees"]
+    chunks = Tree.iter_harvest(species, chunk_size, orchard, n_trees)
+
+    if file_format == "npy":
+        matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.int64, shape=(n_trees, len(metadata["columns"])))
+        for tree_ids, harvest in chunks:
+            matrix[tree_ids[0]:tree_ids[-1] + 1, :-1] = harvest
+            matrix[tree_ids[0]:tree_ids[-1] + 1, -1] = harvest.sum(axis=1)
+        matrix.flush()
+        del matrix
+        with open(path + ".json", "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+        return metadata
+
+    if pa is None:
+        raise ImportError("exporting to " + file_format + " needs pyarrow, use the npy format otherwise")
+
+    schema = pa.schema([("tree", pa.int64())] + [(column, pa.int64()) for column in metadata["columns"]],
+                       metadata={"orchard": json.dumps(metadata)})
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(path, schema)
+    elif file_format == "feather":
+        writer = pa.ipc.new_file(path, schema)
+    else:
+        raise ValueError("unknown export format: " + str(file_format))
+
+    with writer:
+        for tree_ids, harvest in chunks:
+            arrays = [pa.array(tree_ids)] + [pa.array(harvest[:, i]) for i in range(harvest.shape[1])] + [pa.array(harvest.sum(axis=1))]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+    return metadata
+
+
+def read_metadata(path):
+    """This function returns the metadata recorded with an exported harvest"""
+    if harvest_format(path) == "npy":
+        with open(path + ".json") as metadata_file:
+            return json.load(metadata_file)
+    if pa is None:
+        raise ImportError("reading " + path + " needs pyarrow")
+    if harvest_format(path) == "parquet":
+        schema = pq.read_schema(path)
+    else:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    return json.loads(schema.metadata[b"orchard"])
+
+
+def read_harvest(path, years=None, trees=None):
+    """This function reads back (part of) an exported harvest as a dataframe, like the one of species_harvest,
+    without loading the rest of the file.
+    years: the years (e.g. [0, 5, 13]) to read, by default all of them and the 'Total' column
+    trees: a (start, stop) range of tree ids to read, by default all trees"""
+
+    metadata = read_metadata(path)
+    n_trees = metadata["n_trees"]
+    if years is None:
+        columns = metadata["columns"]
+    else:
+        columns = [Tree.iterate_years(year_n) for year_n in years]
+    start, stop = (0, n_trees) if trees is None else (max(trees[0], 0), min(trees[1], n_trees))
+
+    if harvest_format(path) == "npy":
+        # the file is memory mapped, so only the pages of the selected rows are read from disk
+        matrix = np.load(path, mmap_mode="r")
+        selection = matrix[start:stop, [metadata["columns"].index(column) for column in columns]]
+        return pd.DataFrame(np.array(selection), index=pd.RangeIndex(start, stop), columns=columns)
+
+    # only the row groups (or record batches) holding the selected trees are read
+    if harvest_format(path) == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        sizes = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+        read = lambda i: parquet_file.read_row_group(i, columns=columns)
+        source = None
+    else:
+        source = pa.memory_map(path)
+        reader = pa.ipc.open_file(source)
+        sizes = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+        read = lambda i: reader.get_batch(i).select(columns)
+
+    tables = []
+    offset = 0
+    for i, size in enumerate(sizes):
+        if offset < stop and offset + size > start:
+            part = read(i)
+            tables.append(part.slice(max(start - offset, 0), min(stop, offset + size) - max(start, offset)).to_pandas())
+        offset += size
+    if source is not None:
+        source.close()
+
+    if not tables:
+        return pd.DataFrame(columns=columns, dtype=np.int64)
+    harvest_df = pd.concat(tables, ignore_index=True)
+    harvest_df.index = pd.RangeIndex(start, start + len(harvest_df))
+    return harvest_df
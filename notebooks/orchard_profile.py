@@ -0,0 +1,180 @@
+# opt-in instrumentation of simulation runs: call counts, cumulative time, lengths of the strings produced and
+# number of trees processed, for the main phases of a run (string expansion, harvest calculation, tree generation,
+# dataframe assembly, plotting and rendering)
+# while it is disabled, nothing is wrapped, so the simulation runs exactly as without this module
+import inspect
+import time
+
+from orchardproject import Grammar
+from orchardproject import Tree
+from orchardproject import AppleTree
+from orchardproject import PearTree
+from orchardproject import PlumTree
+import orchard_render
+
+
+
+# each measure gets the arguments of the call, by name (with their default values), and its result
+
+def string_length(arguments, result):
+    """the number of characters of a generated string (a python string or a TreeRope)"""
+    return {"chars": result.length if hasattr(result, "length") else len(result)}
+
+
+def one_tree(arguments, result):
+    """the *_per_year functions compute the harvest of one tree"""
+    return {"trees": 1}
+
+
+def generated_trees(arguments, result):
+    """generate_trees(tree_n, tree_age) generates tree_n trees"""
+    return {"trees": arguments["tree_n"]}
+
+
+def harvested_trees(arguments, result):
+    """species_harvest and harvest_matrix return one row per tree"""
+    return {"trees": len(result)}
+
+
+def nothing(arguments, result):
+    """calls that are only timed"""
+    return {}
+
+
+# the instrumented functions: (class or module, function name, phase name, function measuring a call from its arguments
+# and result). Phases nest, so the time of a phase includes the time of the phases it calls: e.g. tree_string,
+# grammar_string and Grammar.rewrite, or species_harvest, harvest_matrix and cohort (the time of species_harvest
+# minus the one of harvest_matrix is the time spent building the dataframe)
+instrumented_functions = [(Tree, "tree_string", "tree_string", string_length),
+                          (Tree, "grammar_string", "grammar_string", string_length),
+                          (Tree, "ith_iteration", "ith_iteration", string_length),
+                          (Grammar, "rewrite", "rewrite", lambda arguments, result: {"chars": len(result)}),
+                          (Tree, "tree_rope", "tree_rope", string_length),
+                          (Tree, "grammar_rope", "grammar_rope", string_length),
+                          (AppleTree, "apples_per_year", "apples_per_year", one_tree),
+                          (PearTree, "pears_per_year", "pears_per_year", one_tree),
+                          (PlumTree, "plums_per_year", "plums_per_year", one_tree),
+                          (AppleTree, "generate_trees", "AppleTree.generate_trees", generated_trees),
+                          (PearTree, "generate_trees", "PearTree.generate_trees", generated_trees),
+                          (PlumTree, "generate_trees", "PlumTree.generate_trees", generated_trees),
+                          (Tree, "species_harvest", "species_harvest", harvested_trees),
+                          (Tree, "harvest_matrix", "harvest_matrix", harvested_trees),
+                          (Tree, "cohort", "cohort", nothing),
+                          (Tree, "grammar_counts", "grammar_counts", nothing),
+                          (AppleTree, "plot_one_tree", "AppleTree.plot_one_tree", one_tree),
+                          (PearTree, "plot_one_tree", "PearTree.plot_one_tree", one_tree),
+                          (PlumTree, "plot_one_tree", "PlumTree.plot_one_tree", one_tree),
+                          (AppleTree, "plot_all_trees", "AppleTree.plot_all_trees", nothing),
+                          (PearTree, "plot_all_trees", "PearTree.plot_all_trees", nothing),
+                          (PlumTree, "plot_all_trees", "PlumTree.plot_all_trees", nothing),
+                          (orchard_render, "render_tree", "render_tree", one_tree),
+                          (orchard_render, "render_all_trees", "render_all_trees", nothing)]
+
+
+class Instrumentation():
+    """Timers and counters around the functions of instrumented_functions.
+    While enabled (see enable, or use it as a context manager: with Instrumentation() as profile: ...), each of these
+    functions is replaced by a wrapper that counts its calls, their cumulative wall-clock time, the characters of the
+    strings produced and the trees processed; disable puts the original functions back.
+    callbacks: functions called after each instrumented call as callback(phase, seconds, measures), e.g. to send
+    job metrics, where measures is a dictionary such as {"chars": 235170} or {"trees": 1}"""
+
+    # the instrumentation that is enabled, if any: only one can wrap the functions at a time
+    active = None
+
+    def __init__(self, callbacks=()):
+        self.callbacks = list(callbacks)
+        self.originals = {}
+        self.counters = {}
+        self.reset()
+
+
+    def reset(self):
+        """This function sets all counters back to zero. The counters are reset in place, so that the wrappers of an
+        enabled instrumentation keep counting into them"""
+        for owner, name, phase, measure in instrumented_functions:
+            self.counters[phase] = {"calls": 0, "seconds": 0.0, "chars": 0, "trees": 0}
+
+
+    def add_callback(self, callback):
+        """This function adds a callback(phase, seconds, measures), called after each instrumented call"""
+        self.callbacks.append(callback)
+
+
+    def wrap(self, function, phase, measure):
+        """This function returns function wrapped with the timer and the counters of phase"""
+        counters = self.counters
+        signature = inspect.signature(function)
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            # the arguments are bound to their names, however they were passed (by position or by keyword)
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            measures = measure(arguments.arguments, result)
+            phase_counters = counters[phase]
+            phase_counters["calls"] += 1
+            phase_counters["seconds"] += seconds
+            for key, value in measures.items():
+                phase_counters[key] += value
+            for callback in self.callbacks:
+                callback(phase, seconds, measures)
+            return result
+
+        instrumented.__name__ = function.__name__
+        instrumented.__doc__ = function.__doc__
+        instrumented.__wrapped__ = function
+        return instrumented
+
+
+    def enable(self):
+        """This function replaces the instrumented functions by their wrappers"""
+        if Instrumentation.active is self:
+            return self
+        if Instrumentation.active is not None:
+            raise RuntimeError("another Instrumentation is already enabled, disable it first")
+        for owner, name, phase, measure in instrumented_functions:
+            # the function is taken from the class (or module) that defines it, so that methods and functions are wrapped alike
+            original = owner.__dict__[name]
+            self.originals[(owner, name)] = original
+            setattr(owner, name, self.wrap(original, phase, measure))
+        Instrumentation.active = self
+        return self
+
+
+    def disable(self):
+        """This function puts the original functions back; the counters are kept"""
+        if Instrumentation.active is not self:
+            return
+        for (owner, name), original in self.originals.items():
+            setattr(owner, name, original)
+        self.originals = {}
+        Instrumentation.active = None
+
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+
+    def report(self):
+        """This function returns the counters of the phases that were called, as a dictionary
+        {phase: {"calls", "seconds", "chars", "trees", "seconds_per_call"}}, ordered by decreasing cumulative time"""
+        report = {}
+        for phase, phase_counters in sorted(self.counters.items(), key=lambda item: -item[1]["seconds"]):
+            if phase_counters["calls"]:
+                report[phase] = dict(phase_counters, seconds_per_call=phase_counters["seconds"] / phase_counters["calls"])
+        return report
+
+
+    def print_report(self):
+        """This function prints the report as a table"""
+        columns = ["calls", "seconds", "seconds_per_call", "chars", "trees"]
+        print("phase".ljust(26) + "  ".join(column.rjust(16) for column in columns))
+        for phase, row in self.report().items():
+            cells = [format(row[column], ".6f") if isinstance(row[column], float) else str(row[column]) for column in columns]
+            print(phase.ljust(26) + "  ".join(cell.rjust(16) for cell in cells))
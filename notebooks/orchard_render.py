@@ -0,0 +1,297 @@
+# headless rendering of tree strings: the turtle drawing of plot_one_tree/plot_all_trees is computed as arrays of
+# line segments (without a Python loop over the characters) and rasterized in bulk to PNG or SVG files,
+# so no display (Tk) is needed
+import struct
+import zlib
+
+import numpy as np
+
+from orchardproject import MappedTreeString
+from orchardproject import Tree
+from orchardproject import TreeStore
+
+
+
+# RGB values of the (Tk) colour names used by the species, as drawn by turtle
+color_values = {"red": (255, 0, 0), "green": (0, 255, 0), "purple": (160, 32, 240), "brown": (165, 42, 42),
+                "white": (255, 255, 255), "black": (0, 0, 0)}
+
+# the layout of plot_all_trees: world coordinates, and for each species the height of its row, and
+# the horizontal position of its first tree and the distance between two trees
+world_coordinates = (-4000, -4000, 4000, 4000)
+layout = {"AppleTree": (-4000, 500, 1200), "PearTree": (-2000, 500, 1700), "PlumTree": (0, 500, 1700)}
+
+
+def symbol_codes(t_string):
+    """This function returns the characters of a tree string as an array of ASCII codes (uint8).
+    t_string: a python string, a TreeRope, a MappedTreeString (whose mapped codes are used as they are, without a copy),
+    or any bytes-like object (bytes, memoryview, numpy array)"""
+    if isinstance(t_string, str):
+        return np.frombuffer(t_string.encode("ascii"), dtype=np.uint8)
+    if isinstance(t_string, MappedTreeString):
+        return t_string.codes
+    if hasattr(t_string, "iter_chunks"):
+        return np.frombuffer("".join(t_string.iter_chunks()).encode("ascii"), dtype=np.uint8)
+    return np.frombuffer(t_string, dtype=np.uint8)
+
+
+def species_form(species_class, orchard=None):
+    """This function returns the branching angle of a species (apple_form, pear_form or plum_form), in degrees"""
+    if orchard is not None:
+        return orchard.forms[species_class.__name__]
+    return getattr(species_class, species_class.__name__[:-len("Tree")].lower() + "_form")
+
+
+class TreeSkeleton:
+    """This class holds the interpretation of a tree string (see interpret) that all trees of the same grammar, age and
+    form share: everything but the segment lengths, which are drawn for each tree (see tree_geometry)"""
+    __slots__ = ("n", "segments", "directions", "closes", "depths", "is_tip")
+
+    def __init__(self, n, segments, directions, closes, depths, is_tip):
+        self.n = n                      # the length of the tree string
+        self.segments = segments        # the index in the string of each segment ("0" or "1")
+        self.directions = directions    # the unit vector of the heading of each segment
+        self.closes = closes            # the index of the "]" closing the branch of each segment (or n)
+        self.depths = depths            # the number of branches open around each segment
+        self.is_tip = is_tip            # whether each segment is a tip ("0") rather than a branch ("1")
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __repr__(self):
+        return "TreeSkeleton(" + str(len(self.segments)) + " segments)"
+
+
+def interpret(codes, form):
+    """This function interprets a tree string as turtle drawing instructions, like plot_one_tree, without drawing anything:
+    "0" and "1" move forward drawing a segment, "[" stores the position and heading and turns left by form (degrees),
+    and "]" goes back to the last stored position and heading and turns right by form.
+    It works on whole arrays at once: brackets are matched level by level, then headings and positions follow from
+    cumulative sums, where the effect of a segment (or of a turn) is cancelled at the "]" that closes its branch.
+    codes: the tree string as ASCII codes (see symbol_codes)
+    It returns a TreeSkeleton, which place turns into segment coordinates"""
+
+    n = len(codes)
+    is_open = codes == ord("[")
+    is_close = codes == ord("]")
+    positions = np.arange(n)
+
+    # depth: the number of branches open before each character
+    steps = is_open.astype(np.int64) - is_close
+    depth = np.cumsum(steps) - steps
+    if n and (depth + steps).min() < 0:
+        raise ValueError("the tree string has a ']' without its '[' at position " + str(int(np.argmax(depth + steps < 0))))
+    # branches still open at the end of the string (e.g. in a slice of a tree string) are closed after its last character,
+    # like turtle leaves them open: the string is interpreted with the missing "]" added, which draw nothing
+    unclosed = int(depth[-1] + steps[-1]) if n else 0
+    if unclosed > 0:
+        closed = interpret(np.concatenate((codes, np.full(unclosed, ord("]"), dtype=np.uint8))), form)
+        return TreeSkeleton(n, closed.segments, closed.directions, np.minimum(closed.closes, n), closed.depths, closed.is_tip)
+    # brackets of the same level alternate "[" and "]", so sorting them by level pairs each "[" with its "]"
+    brackets = positions[is_open | is_close]
+    levels = depth[brackets] - is_close[brackets]
+    pairs = brackets[np.lexsort((brackets, levels))].reshape(-1, 2)
+    opens, closes = pairs[:, 0], pairs[:, 1]
+    close_of = np.full(n + 1, n)
+    close_of[opens] = closes
+
+    # the closing bracket of the innermost branch around each character: the "]" of the last "[" opened one level up
+    enclosing_close = np.full(n, n)
+    open_levels = depth[opens]
+    order = np.lexsort((opens, open_levels))
+    opens_sorted, levels_sorted = opens[order], open_levels[order]
+    for level in range(1, int(depth.max(initial=0)) + 1):
+        level_opens = opens_sorted[levels_sorted == level - 1]
+        at_level = positions[(depth == level) & ~is_close]
+        enclosing_close[at_level] = close_of[level_opens[np.searchsorted(level_opens, at_level) - 1]]
+
+    # headings: "[" turns left until its "]", which restores the heading and turns right until the enclosing "]"
+    turns = (np.bincount(opens, minlength=n + 1) - 2 * np.bincount(closes, minlength=n + 1)
+             + np.bincount(enclosing_close[opens], minlength=n + 1)) * form
+    headings = np.radians(90 + np.cumsum(turns[:n]) - turns[:n])
+
+    segments = positions[(codes == ord("0")) | (codes == ord("1"))]
+    directions = np.stack((np.cos(headings[segments]), np.sin(headings[segments])), axis=1)
+    return TreeSkeleton(n, segments, directions, enclosing_close[segments], depth[segments].astype(np.int32),
+                        codes[segments] == ord("0"))
+
+
+def place(skeleton, lengths, base=(0, 0)):
+    """This function computes the start and end point of each segment of an interpreted tree string (see interpret):
+    a segment moves every character after it, up to the "]" closing its branch, where its displacement is cancelled.
+    lengths: the length of each segment
+    base: the point where the string starts (the top of the trunk)
+    It returns two arrays of (x, y) points: the starts and ends of the segments"""
+    displacement = skeleton.directions * np.asarray(lengths)[:, None]
+    moves = np.empty((skeleton.n + 1, 2))
+    for axis in (0, 1):
+        moves[:, axis] = (np.bincount(skeleton.segments, displacement[:, axis], minlength=skeleton.n + 1)
+                          - np.bincount(skeleton.closes, displacement[:, axis], minlength=skeleton.n + 1))
+    after = np.cumsum(moves, axis=0)[skeleton.segments] + base
+    return after - displacement, after
+
+
+
+# cache of the skeletons of the species' trees, keyed by grammar, age (years) and form, see tree_skeleton
+skeleton_cache = {}
+
+
+def tree_skeleton(species_class, years, form=None, orchard=None):
+    """This function returns the skeleton (see interpret) of the trees of a species at a given age (years), which is
+    computed once and then taken from skeleton_cache: all trees of the same species, age and form share it.
+    form: the branching angle, by default the one of the species (see species_form)"""
+    if form is None:
+        form = species_form(species_class, orchard)
+    key = (species_class.grammar, years, form)
+    if key not in skeleton_cache:
+        skeleton_cache[key] = interpret(symbol_codes(Tree.grammar_rope(species_class.grammar, years)), form)
+    return skeleton_cache[key]
+
+
+def clear_skeleton_cache():
+    """This function empties the skeleton cache"""
+    skeleton_cache.clear()
+
+
+def tree_geometry(species_class, skeleton, base=(0, 0), rng=None):
+    """This function places one tree on its (shared) skeleton: the trunk and segment lengths are drawn for this tree
+    within the ranges of the species, all at once, like plot_one_tree draws them one at a time.
+    rng: a numpy random Generator for the lengths
+    It returns a dictionary of arrays, with one row per segment, the trunk first: "starts" and "ends" (x, y) points,
+    "depths" (the number of branches open around the segment) and "is_tip" (tips "0" or branches "1")"""
+
+    if rng is None:
+        rng = np.random.default_rng()
+    trunk = rng.integers(*species_class.trunk_length)
+    top = (base[0], base[1] + trunk)
+    lengths = np.where(skeleton.is_tip,
+                       rng.integers(*species_class.segment_lengths["0"], size=len(skeleton)),
+                       rng.integers(*species_class.segment_lengths["1"], size=len(skeleton)))
+    starts, ends = place(skeleton, lengths, top)
+
+    return {"starts": np.vstack(([base], starts)),
+            "ends": np.vstack(([top], ends)),
+            "depths": np.concatenate(([0], skeleton.depths)),
+            "is_tip": np.concatenate(([False], skeleton.is_tip))}
+
+
+def tip_coordinates(geometry):
+    """This function returns the end points of the tips (the "0" segments) of a tree geometry (see tree_geometry)"""
+    return geometry["ends"][geometry["is_tip"]]
+
+
+def geometry_groups(species_class, geometry):
+    """This function splits a tree geometry (see tree_geometry) by colour, for drawing.
+    It returns a list of (starts, ends, colour) groups: the branches and the tips"""
+    is_tip = geometry["is_tip"]
+    return [(geometry["starts"][~is_tip], geometry["ends"][~is_tip], species_class.colors["1"]),
+            (geometry["starts"][is_tip], geometry["ends"][is_tip], species_class.colors["0"])]
+
+
+def tree_segments(species_class, t_string, base=(0, 0), orchard=None, rng=None):
+    """This function computes the line segments of a tree drawing, like plot_one_tree of the species class does with turtle:
+    an upright trunk from base, then the tree string, with random segment lengths within the species' ranges.
+    Any string can be drawn; trees of the species' grammar are quicker to draw from their cached skeleton (see tree_skeleton)
+    rng: a numpy random Generator for the segment lengths
+    It returns a list of (starts, ends, colour) groups, one per colour"""
+    skeleton = interpret(symbol_codes(t_string), species_form(species_class, orchard))
+    return geometry_groups(species_class, tree_geometry(species_class, skeleton, base, rng))
+
+
+def rasterize(groups, world=world_coordinates, size=(1000, 1000), background="white", block_size=2**18):
+    """This function draws groups of (starts, ends, colour) segments on an RGB image, one pixel wide, in one pass per group:
+    every segment is sampled at (at least) one point per pixel of its length.
+    world: the world coordinates (llx, lly, urx, ury) mapped onto the image, like turtle's setworldcoordinates
+    block_size: the number of segments sampled at once
+    It returns the image as an array of shape (height, width, 3)"""
+    width, height = size
+    llx, lly, urx, ury = world
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = color_values[background]
+    scale = np.array([(width - 1) / (urx - llx), (height - 1) / (ury - lly)])
+
+    for starts, ends, color in groups:
+        # segments are drawn in blocks, so that the sampled points of a large tree never all are in memory at once
+        for block in range(0, len(starts), block_size):
+            p0 = (np.asarray(starts[block:block + block_size]) - (llx, lly)) * scale
+            p1 = (np.asarray(ends[block:block + block_size]) - (llx, lly)) * scale
+            n_samples = np.ceil(np.abs(p1 - p0).max(axis=1)).astype(np.int64) + 1
+            segment = np.repeat(np.arange(len(p0)), n_samples)
+            offsets = np.cumsum(n_samples) - n_samples
+            fraction = (np.arange(len(segment)) - offsets[segment]) / np.maximum(n_samples[segment] - 1, 1)
+            points = np.rint(p0[segment] + fraction[:, None] * (p1 - p0)[segment]).astype(np.int64)
+            inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+            points = points[inside]
+            # image rows go from the top down, world y from the bottom up
+            image[height - 1 - points[:, 1], points[:, 0]] = color_values[color]
+    return image
+
+
+def write_png(path, image):
+    """This function writes an RGB image array to a PNG file, with the standard library only (zlib)"""
+    height, width, channels = image.shape
+    # each row of the image data starts with its filter type (0: none)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * channels)), axis=1)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        png_file.write(chunk(b"IEND", b""))
+
+
+def write_svg(path, groups, world=world_coordinates, size=(1000, 1000), background="white"):
+    """This function writes groups of (starts, ends, colour) segments to an SVG file, one path per colour"""
+    width, height = size
+    llx, lly, urx, ury = world
+    with open(path, "w") as svg_file:
+        svg_file.write('<svg xmlns="http://www.w3.org/2000/svg" width="' + str(width) + '" height="' + str(height)
+                       + '" viewBox="' + str(llx) + " " + str(-ury) + " " + str(urx - llx) + " " + str(ury - lly) + '">\n')
+        svg_file.write('<rect x="' + str(llx) + '" y="' + str(-ury) + '" width="' + str(urx - llx) + '" height="' + str(ury - lly)
+                       + '" fill="' + background + '"/>\n')
+        stroke = (urx - llx) / width
+        for starts, ends, color in groups:
+            if len(starts) == 0:
+                continue
+            # world y goes up, SVG y goes down
+            coordinates = np.column_stack((starts[:, 0], -starts[:, 1], ends[:, 0], -ends[:, 1]))
+            path_data = " ".join("M%.1f %.1fL%.1f %.1f" % tuple(row) for row in coordinates.tolist())
+            svg_file.write('<path fill="none" stroke="' + color + '" stroke-width="' + str(stroke) + '" d="' + path_data + '"/>\n')
+        svg_file.write("</svg>\n")
+
+
+def save(path, groups, world=world_coordinates, size=(1000, 1000), background="white"):
+    """This function renders groups of segments to an image file, SVG if path ends with .svg and PNG otherwise"""
+    if path.endswith(".svg"):
+        write_svg(path, groups, world, size, background)
+    else:
+        write_png(path, rasterize(groups, world, size, background))
+
+
+def render_tree(path, species, t_string, world=(-2000, -2000, 2000, 2000), base=(0, -1800), size=(1000, 1000), orchard=None, rng=None):
+    """This function renders one tree string of a species to an image file (PNG or SVG), like plot_one_tree does on screen"""
+    save(path, tree_segments(Tree.species_class(species), t_string, base, orchard, rng), world, size)
+
+
+def render_all_trees(path, species_list=TreeStore.species_names, size=(1000, 1000), orchard=None, rng=None):
+    """This function renders all tree instances (see generate_trees) of the given species to one image file (PNG or SVG),
+    with the layout of plot_all_trees: one row of trees per species.
+    Trees of the species' grammar are drawn from the skeleton of their age (see tree_skeleton); trees with their own
+    string (added one by one, or grown from a StochasticGrammar) are interpreted from it"""
+    groups = []
+    for species in species_list:
+        species_class = Tree.species_class(species)
+        row, xdist, step = layout[species_class.__name__]
+        for tree in species_class.instances:
+            if tree.has_own_string or tree.age < 0:
+                skeleton = interpret(symbol_codes(tree.string), species_form(species_class, orchard))
+            else:
+                # all trees of the same age share their skeleton, only their segment lengths differ
+                skeleton = tree_skeleton(species_class, tree.age, orchard=orchard)
+            geometry = tree_geometry(species_class, skeleton, (world_coordinates[0] + xdist, row), rng)
+            groups.extend(geometry_groups(species_class, geometry))
+            xdist += step
+    save(path, groups, world_coordinates, size)
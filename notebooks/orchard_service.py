@@ -0,0 +1,191 @@
+# a local HTTP/JSON service answering orchard scenarios, built on asyncio (standard library only)
+# run from the notebooks folder with: python orchard_service.py [--port 8765] [--workers 2] [--cache-size 256]
+# then e.g.: curl "http://127.0.0.1:8765/simulate?orchard_size=50&gprob_apple=0.6&seed=7"
+# simulations run in a pool of worker processes; concurrent identical requests (same parameters and seed) share one
+# computation, and recent results are kept in a bounded LRU cache, so repeated scenarios are answered at once
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import TreeStore
+
+
+
+# the parameters of a scenario, with their type and default value
+scenario_parameters = {"orchard_size": (float, 5), "gprob_apple": (float, 0.7), "gprob_pear": (float, 0.7),
+                       "gprob_plum": (float, 0.7), "seed": (int, None)}
+
+# the service only listens on the local machine
+local_hosts = ("127.0.0.1", "localhost", "::1")
+
+
+def scenario(query):
+    """This function reads the parameters of a scenario from a dictionary of (string) query values, with their defaults.
+    A scenario without seed gets a random one, which is returned with its results"""
+    parameters = {}
+    for name, value in query.items():
+        if name not in scenario_parameters:
+            raise ValueError("unknown parameter: " + name)
+        parameters[name] = scenario_parameters[name][0](value)
+    for name, (kind, default) in scenario_parameters.items():
+        parameters.setdefault(name, default)
+    if parameters["seed"] is None:
+        parameters["seed"] = random.getrandbits(63)
+    return parameters
+
+
+def simulate_scenario(orchard_size, gprob_apple, gprob_pear, gprob_plum, seed):
+    """This function simulates one orchard (the work of orchard() and species_harvest of all species), in a worker process.
+    It returns the results as a JSON-ready dictionary: the land split, the tree counts, the maturation thresholds,
+    and the yearly total harvest of each species (see Tree.yearly_totals)"""
+    scenario_orchard = Orchard(orchard_size, gprob_apple, gprob_pear, gprob_plum, seed=seed)
+    return {"parameters": {"orchard_size": orchard_size, "gprob_apple": gprob_apple, "gprob_pear": gprob_pear,
+                           "gprob_plum": gprob_plum, "seed": seed},
+            "land_dict": scenario_orchard.land_dict,
+            "tree_counts": scenario_orchard.tree_counts,
+            "maturation_thresholds": scenario_orchard.maturation_thresholds,
+            "yearly_totals": {species: Tree.yearly_totals(species, orchard=scenario_orchard).tolist() for species in TreeStore.species_names}}
+
+
+class OrchardService():
+    """The state of the service: the pool of worker processes, the computations in flight and the LRU cache of results.
+    workers: the number of worker processes; with 0, simulations run in threads of this process instead
+    cache_size: the number of scenarios whose results are kept"""
+
+    def __init__(self, workers=2, cache_size=256):
+        # workers are started fresh ("spawn") rather than forked: forked workers would inherit the open client
+        # connections of the moment, and keep them open after the service closes them
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 0 else None
+        self.cache_size = cache_size
+        self.cache = OrderedDict()      # {scenario key: results}, from the least to the most recently used
+        self.in_flight = {}             # {scenario key: future of the computation}, for coalescing identical requests
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "computed": 0, "errors": 0}
+
+
+    async def results(self, parameters):
+        """This function returns the results of a scenario: from the cache, from the computation of an identical
+        request in flight, or from a new computation in the worker pool"""
+        key = tuple(sorted(parameters.items()))
+        self.stats["requests"] += 1
+
+        if key in self.cache:
+            self.stats["cache_hits"] += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, simulate_scenario, parameters["orchard_size"], parameters["gprob_apple"],
+                                      parameters["gprob_pear"], parameters["gprob_plum"], parameters["seed"])
+        self.in_flight[key] = future
+        try:
+            results = await asyncio.shield(future)
+        finally:
+            del self.in_flight[key]
+        self.stats["computed"] += 1
+
+        self.cache[key] = results
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return results
+
+
+    async def respond(self, method, target, body):
+        """This function answers one HTTP request. It returns the status code and the JSON-ready answer"""
+        url = urlsplit(target)
+        if url.path == "/stats" and method == "GET":
+            return 200, dict(self.stats, cached=len(self.cache), in_flight=len(self.in_flight))
+        if url.path != "/simulate" or method not in ("GET", "POST"):
+            return 404, {"error": "unknown resource, use GET or POST /simulate, or GET /stats"}
+
+        try:
+            query = dict(parse_qsl(url.query))
+            if method == "POST" and body:
+                query.update(json.loads(body))
+            parameters = scenario(query)
+        except (ValueError, TypeError) as error:
+            self.stats["errors"] += 1
+            return 400, {"error": str(error)}
+        return 200, await self.results(parameters)
+
+
+    async def handle(self, reader, writer):
+        """This function serves the HTTP/1.1 requests of one connection, one after the other (keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                start = time.perf_counter()
+                try:
+                    status, answer = await self.respond(method, target, body)
+                except Exception as error:
+                    self.stats["errors"] += 1
+                    status, answer = 500, {"error": repr(error)}
+                payload = json.dumps(answer).encode()
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close" and version == "HTTP/1.1"
+                writer.write(("HTTP/1.1 " + str(status) + (" OK" if status == 200 else " Error") + "\r\n"
+                              + "Content-Type: application/json\r\n"
+                              + "Content-Length: " + str(len(payload)) + "\r\n"
+                              + "X-Elapsed-Seconds: " + format(time.perf_counter() - start, ".6f") + "\r\n"
+                              + "Connection: " + ("keep-alive" if keep_alive else "close") + "\r\n\r\n").encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+    def close(self):
+        """This function shuts the worker pool down"""
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+async def serve(host="127.0.0.1", port=8765, workers=2, cache_size=256):
+    """This function runs the service on the local machine until it is cancelled"""
+    if host not in local_hosts:
+        raise ValueError("the service only runs on the local machine, use one of " + str(local_hosts))
+    service = OrchardService(workers, cache_size)
+    server = await asyncio.start_server(service.handle, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local HTTP/JSON service of orchard scenarios")
+    parser.add_argument("--host", default="127.0.0.1", help="local address to listen on")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="number of worker processes")
+    parser.add_argument("--cache-size", type=int, default=256, help="number of scenarios whose results are kept")
+    arguments = parser.parse_args()
+    print("serving orchard scenarios on http://" + arguments.host + ":" + str(arguments.port))
+    asyncio.run(serve(arguments.host, arguments.port, arguments.workers, arguments.cache_size))
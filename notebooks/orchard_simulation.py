@@ -0,0 +1,110 @@
+# a stateful simulation of an orchard, advanced one year at a time: it can be paused, inspected and continued
+import numpy as np
+import pandas as pd
+
+from orchardproject import Tree
+from orchardproject import TreeStore
+
+
+
+class OrchardSimulation():
+    """The simulation of an orchard (by default the default orchard, see Tree.default_orchard), year by year.
+    Each call of step advances all trees by one year: the string of each cohort age grows by one rewrite generation
+    (the ropes of the previous generation are reused, see Tree.grammar_rope), and the fruits of the trees standing
+    that year are harvested and added to the harvest state. Nothing is recomputed from the axiom or from year 0, so
+    simulating n years costs n steps, and the state can be inspected (or the orchard replanted, see
+    Orchard.add_planting) between steps.
+    After stepping over the whole time line, harvest(species) is equal to Tree.species_harvest(species, orchard=orchard)"""
+
+    def __init__(self, orchard=None, species_list=TreeStore.species_names):
+        self.orchard = orchard
+        self.species_list = [Tree.species_class(species).__name__ for species in species_list]
+        self.year = -1                                              # the last simulated year, -1 before the first step
+        self.strings = {species: {} for species in self.species_list}   # {species: {age: tree string}} of the trees standing
+        self.fruits = {species: [] for species in self.species_list}    # {species: [fruits of each tree standing, for each year]}
+        self.totals = {species: np.zeros(0, dtype=np.int64) for species in self.species_list}   # fruits of each tree so far
+
+
+    def plantings(self, species):
+        """This function returns the planting schedule of a species (see Orchard.plantings)"""
+        return (Tree.default_orchard() if self.orchard is None else self.orchard).plantings[species]
+
+
+    def planted_trees(self, species, year=None):
+        """This function returns the ids of the trees of a species standing in a year, by default the last simulated one,
+        and their ages, as two arrays"""
+        if year is None:
+            year = self.year
+        tree_ids = []
+        ages = []
+        first_id = 0
+        for planting_year, n_trees in self.plantings(Tree.species_class(species).__name__):
+            if planting_year <= year:
+                tree_ids.append(np.arange(first_id, first_id + n_trees))
+                ages.append(np.full(n_trees, year - planting_year))
+            first_id += n_trees
+        if not tree_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(tree_ids), np.concatenate(ages)
+
+
+    def step(self, n_years=1):
+        """This function advances the simulation by n_years years, one year at a time, and returns the simulation"""
+        for i in range(n_years):
+            self.year += 1
+            for species in self.species_list:
+                species_class = Tree.species_class(species)
+                tree_ids, ages = self.planted_trees(species)
+
+                # one more generation for the string of every age standing this year (the strings of ages that are
+                # not standing anymore are dropped)
+                self.strings[species] = {int(age): Tree.grammar_rope(species_class.grammar, int(age)) for age in np.unique(ages)}
+
+                # the harvest of this year only, for the trees standing
+                fruits = Tree.harvest_matrix(species_class, orchard=self.orchard, tree_ids=tree_ids, years=[self.year])[:, 0]
+                self.fruits[species].append(fruits)
+                if len(self.totals[species]) < len(tree_ids):
+                    self.totals[species] = np.concatenate((self.totals[species], np.zeros(len(tree_ids) - len(self.totals[species]), dtype=np.int64)))
+                self.totals[species][tree_ids] += fruits
+        return self
+
+
+    def run(self, until_year=None):
+        """This function steps the simulation until a given year, by default the last year of the time line (see Tree.time_line)"""
+        if until_year is None:
+            until_year = len(Tree.time_line) - 1
+        return self.step(until_year - self.year)
+
+
+    def yearly_totals(self, species):
+        """This function returns the total harvest of a species in each simulated year"""
+        return np.array([fruits.sum() for fruits in self.fruits[Tree.species_class(species).__name__]], dtype=np.int64)
+
+
+    def harvest(self, species):
+        """This function returns the harvest of a species over the simulated years as a dataframe, like species_harvest:
+        one row per tree of the orchard (trees not planted yet bear no fruit), one column per simulated year, and the 'Total' column"""
+        species = Tree.species_class(species).__name__
+        matrix = np.zeros((Tree.species_tree_count(species, self.orchard), self.year + 1), dtype=np.int64)
+        for year_n, fruits in enumerate(self.fruits[species]):
+            matrix[self.planted_trees(species, year_n)[0], year_n] = fruits
+        harvest_df = pd.DataFrame(matrix, columns=[Tree.iterate_years(year_n) for year_n in range(self.year + 1)])
+        harvest_df['Total'] = matrix.sum(axis=1)
+        return harvest_df
+
+
+    def fill_instances(self, species):
+        """This function stores the trees of a species standing in the last simulated year in the species' instances store
+        (like Tree.generate_orchard_trees), from the state of the simulation, without computing anything again"""
+        species_class = Tree.species_class(species)
+        tree_ids, ages = self.planted_trees(species_class.__name__)
+        fruits = self.fruits[species_class.__name__][-1] if self.year >= 0 else np.zeros(0, dtype=np.int64)
+        species_class.instances.clear()
+        for age, tree_string in self.strings[species_class.__name__].items():
+            cohort = ages == age
+            species_class.instances.fill(species_class.__name__, age, fruits[cohort], tree_string, tree_ids[cohort])
+
+
+    def __repr__(self):
+        counts = {species: len(self.planted_trees(species)[0]) for species in self.species_list}
+        return "OrchardSimulation(year=" + str(self.year) + ", trees=" + str(counts) + ")"
@@ -2,37 +2,46 @@
 import turtle as t
 import numpy as np
 import random
+import types
+import os
+import hashlib
+import tempfile
 import pandas as pd
 
 
 
 # generation of the orchard
 
-def orchard(orchard_size = 5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7):
+def orchard_land(orchard_size = 5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7, rand=random):
         """This function randomly assigns a percentage (0-100%) of orchard land for each tree type of apple, pear, and plum trees.
         
         orchard_size: the number of acres to be assigned to the orchard.
         gprob_apple: the growth probability that an apple tree seed has, expressed as a number within [0,100]
         gprob_pear: the growth probability that an pear tree seed has
-        gprob_plum: the growth probability that an plum tree seed has."""
+        gprob_plum: the growth probability that an plum tree seed has.
+        rand: the source of random numbers, the random module or a random.Random instance.
+        It returns the dictionary of land proportions and the number of apple, pear and plum trees."""
         
         # the land proportion to be assigned to apple trees is defined
-        lpercent_apples = random.randint(2, 100)
+        lpercent_apples = rand.randint(2, 100)
         left_over = 100 - lpercent_apples
         
         if left_over > 0:
             # the land proportion to be assigned to pear trees is defined
-            lpercent_pears = random.randint(1, left_over)
+            lpercent_pears = rand.randint(1, left_over)
                 
             # the land proportion to be assigned to plum trees is defined
             lpercent_plums = 100 - (lpercent_apples + lpercent_pears)
+        else:
+            # all the land goes to apple trees
+            lpercent_pears = 0
+            lpercent_plums = 0
             
-            # all land proportions are stored in a dictionary
-            global land_dict
-            land_dict = {'apples': lpercent_apples, 'pears': lpercent_pears, 'plums': lpercent_plums}
+        # all land proportions are stored in a dictionary
+        land_dict = {'apples': lpercent_apples, 'pears': lpercent_pears, 'plums': lpercent_plums}
 
         apple_land = orchard_size * (.01 * land_dict['apples']) # amount of acres dedicated to growing apples
-        apple_seeds = random.uniform(1.5, 1.8) # number of apple tree seeds sown per acre
+        apple_seeds = rand.uniform(1.5, 1.8) # number of apple tree seeds sown per acre
         base_apple = apple_land * apple_seeds # base number of apple trees in the original orchard, that theoretically could grow
         base_apple = round(base_apple) + 2 # base number of apple trees in the original orchard rounded to a whole number + 2 to ensure that we have at least multiple trees for each tree type
         apple_trees = round(gprob_apple*base_apple) #actual number of apple trees that have grown from the sown seeds
@@ -44,23 +53,660 @@ def orchard(orchard_size = 5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7):
         pear_trees = round(gprob_pear*base_pear) #actual number of apple trees that have grown from the sown seeds
         
         plum_land = orchard_size * (.01 * land_dict['plums']) # amount of acres dedicated to growing plums
-        plum_seeds = random.uniform(0.70, 1.09) # number of plum tree seeds sown per acre
+        plum_seeds = rand.uniform(0.70, 1.09) # number of plum tree seeds sown per acre
         base_plum = plum_land * plum_seeds # base number of plum trees in the original orchard, that theoretically could grow
         base_plum = round(base_plum) + 2 # base number of plum trees in the original orchard rounded to a whole number + 2 to ensure that we have at least multiple trees for each tree type
         plum_trees = round(gprob_plum*base_plum) # actual number of apple trees that have grown from the sown seeds
         
-        return apple_trees, pear_trees, plum_trees
+        return land_dict, (apple_trees, pear_trees, plum_trees)
+
+
+def orchard(orchard_size = 5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7):
+        """This function randomly assigns a percentage (0-100%) of orchard land for each tree type (see orchard_land),
+        stores the land proportions in the global land_dict, and returns the number of apple, pear and plum trees."""
+        global land_dict
+        land_dict, tree_counts = orchard_land(orchard_size, gprob_apple, gprob_pear, gprob_plum)
+        return tree_counts
+
+
+
+# an orchard, with all its random characteristics, can also be created as an object, on demand
+
+class Orchard():
+    """An orchard: the split of its land between apple, pear and plum trees, the resulting number of trees of each species,
+    and the characteristics drawn for each species (maturation threshold and tree form).
+    Everything is drawn when the orchard is created, from the orchard's own random generator, so that many independent
+    (and reproducible) orchards can be created in one process. When no seed is given, one is drawn from the random module.
+    The seed also keys the harvest of every tree and year (see Tree.harvest_draws).
+    All trees are planted in year 0 of the time line, but more cohorts of trees can be planted later (see add_planting)"""
+
+    def __init__(self, orchard_size=5, gprob_apple=0.7, gprob_pear=0.7, gprob_plum=0.7, seed=None, maturation_ranges=None):
+        self.orchard_size = orchard_size
+        self.growth_probabilities = {"AppleTree": gprob_apple, "PearTree": gprob_pear, "PlumTree": gprob_plum}
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.rand = random.Random(self.seed)
+
+        self.land_dict, tree_counts = orchard_land(orchard_size, gprob_apple, gprob_pear, gprob_plum, self.rand)
+        self.tree_counts = dict(zip(("AppleTree", "PearTree", "PlumTree"), tree_counts))
+        # the planting schedule of each species: a list of (planting year, number of trees) cohorts, in the order of the
+        # tree ids, i.e. the first cohort has the trees 0, 1, ..., n-1, the second one the next trees, and so on
+        self.plantings = {species: [(0, n_trees)] for species, n_trees in self.tree_counts.items()}
+
+        # the characteristics of each species are drawn within the ranges found in the literature (see the species classes),
+        # or within the maturation ranges given for some species, e.g. {"PlumTree": (3, 4)}
+        if maturation_ranges is None:
+            maturation_ranges = {}
+        self.maturation_thresholds = {}
+        self.forms = {}
+        for species_class in (AppleTree, PearTree, PlumTree):
+            maturation_range = maturation_ranges.get(species_class.__name__, species_class.maturation_range)
+            self.maturation_thresholds[species_class.__name__] = self.rand.uniform(*maturation_range)
+            self.forms[species_class.__name__] = self.rand.randrange(*species_class.form_range)
+
+
+    def add_planting(self, species, year, n_trees):
+        """This function plants a new cohort of n_trees trees of a species in a given year of the time line (e.g. when
+        replanting, or adding a block of trees). The new trees get the next tree ids, after all the trees planted so far"""
+        species = Tree.species_class(species).__name__
+        self.plantings[species].append((year, n_trees))
+        self.tree_counts[species] += n_trees
+
+
+    def planting_years(self, species, tree_ids):
+        """This function returns the year in which each of the given trees of a species was planted (see plantings)"""
+        years, n_trees = zip(*self.plantings[Tree.species_class(species).__name__])
+        # the first tree id of each cohort after the first one
+        starts = np.cumsum(n_trees)[:-1]
+        return np.asarray(years)[np.searchsorted(starts, np.asarray(tree_ids), side="right")]
+
+
+    def __repr__(self):
+        return "Orchard(orchard_size=" + str(self.orchard_size) + ", seed=" + str(self.seed) + ", tree_counts=" + str(self.tree_counts) + ")"
+
+
+
+class OrchardAttribute():
+    """A class attribute whose value is taken from the default orchard (see Tree.default_orchard), for the species
+    of the class it is read from (or a given species). The default orchard is only created when such an attribute
+    is read for the first time, not when the module is imported. Assigning the class attribute replaces it as usual"""
+
+    def __init__(self, name, species=None):
+        self.name = name
+        self.species = species
+
+    def __get__(self, instance, owner):
+        species = owner.__name__ if self.species is None else self.species
+        return getattr(Tree.default_orchard(), self.name)[species]
+
+
+
+# tree strings grow exponentially with the years, so they can also be stored as ropes: a rope is a directed acyclic graph,
+# where the expansion of a symbol after n years is a node pointing to the expansions (after n-1 years) of its rule's output.
+# Identical sub-strings are stored only once, thus the memory needed grows with the number of years, not the string length
+
+class RopeNode():
+    """One node of a rope: the concatenation of its children, each one either a (short) python string or another RopeNode.
+    The length and the symbol counts of the node are computed once, when the node is created"""
+
+    __slots__ = ("children", "length", "counts")
+
+    def __init__(self, children):
+        self.children = tuple(children)
+        self.length = 0
+        self.counts = {}
+        for child in self.children:
+            if isinstance(child, str):
+                self.length += len(child)
+                for c in child:
+                    self.counts[c] = self.counts.get(c, 0) + 1
+            else:
+                self.length += child.length
+                for c, n in child.counts.items():
+                    self.counts[c] = self.counts.get(c, 0) + n
+
+
+
+class TreeRope():
+    """A tree string stored as a rope (see RopeNode): it can be iterated, measured (len), counted and sliced
+    like a python string, without ever building the whole string"""
+
+    # sub-strings up to this length are stored flat, as python strings, in the leaves of the rope
+    leaf_size = 4096
+
+    def __init__(self, node):
+        self.node = node
+        # the length is also kept as an attribute, since len() cannot return numbers above 2**63 (reached by long horizons)
+        self.length = len(node) if isinstance(node, str) else node.length
+
+
+    def from_rules(axiom, rules, years, expansions=None):
+        """This function builds the rope of the tree string generated from an axiom and (set up and checked) rules,
+        at a specified time (years), like Tree.tree_string.
+        expansions: a dictionary {(symbol, years): node} of expansions already built for the same rules, which is
+        reused and completed, so that ropes of several years of the same rules share all their nodes"""
+
+        if expansions is None:
+            expansions = {}
+        for c in rules:
+            expansions[(c, 0)] = c
+
+        for year in range(1, years + 1):
+            for c, new_string in rules.items():
+                if (c, year) in expansions:
+                    continue
+                expansions[(c, year)] = TreeRope.concat(expansions[(s, year - 1)] for s in new_string)
+
+        if years == 0:
+            return TreeRope(axiom)
+        if len(axiom) == 1:
+            return TreeRope(expansions[(axiom, years)])
+        return TreeRope(RopeNode(expansions[(c, years)] for c in axiom))
+
+
+    def concat(parts):
+        """This function concatenates strings and rope nodes into one node, where consecutive short strings are merged
+        into one flat string (up to leaf_size characters). It returns the only part left, if there is just one"""
+        children = []
+        for child in parts:
+            if children and isinstance(child, str) and isinstance(children[-1], str) and len(children[-1]) + len(child) <= TreeRope.leaf_size:
+                children[-1] = children[-1] + child
+            else:
+                children.append(child)
+        if len(children) == 1:
+            return children[0]
+        return RopeNode(children)
+
+
+    def __len__(self):
+        return self.length
+
+
+    def count(self, symbol):
+        """This function returns the number of occurrences of a single symbol in the tree string"""
+        if isinstance(self.node, str):
+            return self.node.count(symbol)
+        return self.node.counts.get(symbol, 0)
+
+
+    def iter_chunks(self):
+        """This function yields the tree string, from left to right, as a sequence of flat python strings"""
+        # nodes still to visit are stored in a stack, so the rightmost child is pushed first
+        stack = [self.node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                yield node
+            else:
+                stack.extend(reversed(node.children))
+
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+
+    def __getitem__(self, index):
+        length = self.length
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            positions = range(start, stop, step)
+            if len(positions) == 0:
+                return ""
+            # only the requested range is flattened (from its first to its last position), then the step is applied to it
+            lo = min(positions[0], positions[-1])
+            hi = max(positions[0], positions[-1]) + 1
+            flat = "".join(TreeRope.substring(self.node, lo, hi))
+            return flat if step == 1 else flat[::step]
+
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("tree string index out of range")
+        node = self.node
+        while not isinstance(node, str):
+            for child in node.children:
+                child_length = len(child) if isinstance(child, str) else child.length
+                if index < child_length:
+                    node = child
+                    break
+                index -= child_length
+        return node[index]
+
+
+    def substring(node, start, stop):
+        """This function yields the pieces of the string of a node between the positions start and stop"""
+        if isinstance(node, str):
+            yield node[start:stop]
+            return
+        offset = 0
+        for child in node.children:
+            child_length = len(child) if isinstance(child, str) else child.length
+            if offset >= stop:
+                break
+            if offset + child_length > start:
+                yield from TreeRope.substring(child, max(start - offset, 0), min(stop - offset, child_length))
+            offset += child_length
+
+
+    def __str__(self):
+        return "".join(self.iter_chunks())
+
+
+    def __repr__(self):
+        return "TreeRope(length=" + str(self.length) + ")"
+
+
+
+class MappedTreeString():
+    """A tree string stored as bytes (ASCII codes) in a file, and memory-mapped rather than read (see Tree.mapped_string):
+    the operating system pages the characters in and out as they are used, so strings larger than the memory can be
+    counted, sliced, iterated and drawn like a python string. Slices are views of the same file, nothing is copied;
+    any slice can be drawn (see orchard_render.render_tree), branches left open at its end are drawn as turtle does
+    codes: the characters as a numpy array of uint8 (a numpy memmap, or a view of one)"""
+
+    # the number of characters processed at once by count and iter_chunks
+    block_size = 2**22
+
+    def __init__(self, codes, path=None):
+        self.codes = codes
+        self.path = path
+
+
+    def open(path):
+        """This function maps the tree string stored in a file (read-only)"""
+        return MappedTreeString(np.memmap(path, dtype=np.uint8, mode="r"), path)
+
+
+    def __len__(self):
+        return len(self.codes)
+
+
+    def count(self, symbol):
+        """This function returns the number of occurrences of a single symbol in the tree string, block by block"""
+        code = ord(symbol)
+        return sum(int(np.count_nonzero(self.codes[i:i + MappedTreeString.block_size] == code))
+                   for i in range(0, len(self.codes), MappedTreeString.block_size))
+
+
+    def iter_chunks(self):
+        """This function yields the tree string, from left to right, as a sequence of flat python strings"""
+        for i in range(0, len(self.codes), MappedTreeString.block_size):
+            yield self.codes[i:i + MappedTreeString.block_size].tobytes().decode("ascii")
+
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+
+    def __getitem__(self, index):
+        # a slice is a view of the same mapped bytes, which str() turns into a python string
+        if isinstance(index, slice):
+            return MappedTreeString(self.codes[index], self.path)
+        return chr(self.codes[index])
+
+
+    def __str__(self):
+        return "".join(self.iter_chunks())
+
+
+    def __repr__(self):
+        return "MappedTreeString(length=" + str(len(self.codes)) + ", path=" + repr(self.path) + ")"
+
+
+
+# the trees of the orchard are stored column by column, rather than as one python object per tree
+
+class TreeStore():
+    """A compact, columnar store of trees: the id, species, age and fruits of the trees are kept in numpy arrays,
+    with one entry per tree, while each tree string is kept only once for each (species, age) and shared by all those trees.
+    It can be indexed, iterated and measured (len) like a list of trees, giving lightweight TreeView objects"""
+
+    # species are stored as their index in this tuple
+    species_names = ("AppleTree", "PearTree", "PlumTree")
+
+    # value stored in the fruits column of trees whose number of fruits is not known (None)
+    no_fruits = np.iinfo(np.int64).min
+
+    def __init__(self):
+        self.clear()
+
+
+    def clear(self):
+        """This function removes all trees from the store"""
+        self.id = np.zeros(0, dtype=np.int64)
+        self.species = np.zeros(0, dtype=np.int8)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.fruits = np.zeros(0, dtype=np.int64)
+        self.strings = {}       # {(species, age): tree string}
+        self.row_strings = {}   # {row: tree string}, for single trees added with their own string (see append)
+
+
+    def fill(self, species, tree_age, fruits, string, ids=None):
+        """This function adds, in one go, trees of the same species and age to the store.
+        species: the species name of the trees
+        tree_age: the age of the trees
+        fruits: the number of fruits of each tree (a sequence or array, one entry per tree)
+        string: the tree string shared by all the trees, or a list with the own string of each tree
+        ids: the id of each tree, by default 0, 1, ..., N-1"""
+        fruits = np.asarray(fruits, dtype=np.int64)
+        if ids is None:
+            ids = np.arange(len(fruits))
+        if isinstance(string, list):
+            for i, tree_string in enumerate(string):
+                self.row_strings[len(self) + i] = tree_string
+        self.id = np.concatenate((self.id, np.asarray(ids, dtype=np.int64)))
+        self.species = np.concatenate((self.species, np.full(len(fruits), TreeStore.species_names.index(species), dtype=np.int8)))
+        self.age = np.concatenate((self.age, np.full(len(fruits), tree_age, dtype=np.int64)))
+        self.fruits = np.concatenate((self.fruits, fruits))
+        self.strings[(species, tree_age)] = string
+
+
+    def append(self, tree):
+        """This function adds a single tree object (e.g. an AppleTree) to the store; its age is not known, so it is stored as -1"""
+        self.row_strings[len(self)] = tree.string
+        fruits = TreeStore.no_fruits if tree.fruits is None else tree.fruits
+        self.id = np.append(self.id, tree.id)
+        self.species = np.append(self.species, np.int8(TreeStore.species_names.index(type(tree).__name__)))
+        self.age = np.append(self.age, -1)
+        self.fruits = np.append(self.fruits, fruits)
+
+
+    def __len__(self):
+        return len(self.id)
+
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("tree index out of range")
+        return TreeView(self, row)
+
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield TreeView(self, row)
+
+
+
+class TreeView():
+    """A view of one tree of a TreeStore, with the same attributes as a tree object: id, string and fruits (plus species and age).
+    Views do not hold any data themselves, reading or setting an attribute reads or sets the store's columns"""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self):
+        return int(self.store.id[self.row])
+
+    @property
+    def species(self):
+        return TreeStore.species_names[self.store.species[self.row]]
+
+    @property
+    def age(self):
+        return int(self.store.age[self.row])
+
+    @property
+    def string(self):
+        if self.row in self.store.row_strings:
+            return self.store.row_strings[self.row]
+        return self.store.strings[(self.species, self.age)]
+
+    @property
+    def has_own_string(self):
+        # whether the tree has its own string, rather than the one shared by its species and age
+        return self.row in self.store.row_strings
+
+    @property
+    def fruits(self):
+        fruits = self.store.fruits[self.row]
+        return None if fruits == TreeStore.no_fruits else int(fruits)
+
+    @fruits.setter
+    def fruits(self, fruits):
+        self.store.fruits[self.row] = TreeStore.no_fruits if fruits is None else fruits
+
+    def __str__(self):
+        return self.species + " nr.: "+ str(self.id) +" with tree string: "+ str(self.string) + "and nr. of fruits: "+ str(self.fruits)
+
+
+
+# counter-based random numbers: a random number is computed from a key and a counter only, with no state carried
+# from one number to the next, so that any number of a sequence can be computed directly, in any order or in parallel
+
+def philox4x32(counter, key, rounds=10):
+    """This function computes the Philox4x32 random numbers (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", 2011)
+    of a counter, for a given key. It works on whole numpy arrays at once.
+    counter: four arrays (or numbers) of 32 bits integers, broadcast against each other
+    key: two 32 bits integers
+    It returns four uint64 arrays, each one holding 32 random bits"""
+
+    c0, c1, c2, c3 = np.broadcast_arrays(*[np.asarray(word, dtype=np.uint64) for word in counter])
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    mask = np.uint64(0xFFFFFFFF)
+    for i in range(rounds):
+        if i > 0:
+            # the key is bumped between two rounds by the Weyl constants
+            k0 = (k0 + np.uint64(0x9E3779B9)) & mask
+            k1 = (k1 + np.uint64(0xBB67AE85)) & mask
+        # both products of two 32 bits numbers fit in 64 bits, they are split into their high and low halves
+        product0 = c0 * np.uint64(0xD2511F53)
+        product1 = c2 * np.uint64(0xCD9E8D57)
+        c0, c1, c2, c3 = (product1 >> np.uint64(32)) ^ c1 ^ k0, product1 & mask, (product0 >> np.uint64(32)) ^ c3 ^ k1, product0 & mask
+    return c0, c1, c2, c3
+
+
+
+class Grammar():
+    """The L-system of a tree species: its axiom, constants, variables and rules, checked (see Tree.input_check) once,
+    when the grammar is created, and then frozen. The constants' rules are added to a copy of the rules (see
+    Tree.rules_setup), so the dictionary given is never changed, and the lookup table that rewrites strings
+    (see Tree.compile_rules) is computed once as well.
+    Grammars are hashable: grammars with the same axiom and rules are equal, so they can key the caches of
+    generated strings, ropes and symbol counts"""
+
+    __slots__ = ("axiom", "constants", "variables", "rules", "frozen_rules", "table", "has_rule")
+
+    def __init__(self, axiom, constants, variables, rules):
+        rules = Tree.rules_setup(constants, dict(rules))
+        Tree.input_check(constants, variables, rules, axiom=axiom)
+        # the attributes are set once here, afterwards the grammar cannot be changed (see __setattr__)
+        object.__setattr__(self, "axiom", axiom)
+        object.__setattr__(self, "constants", tuple(constants))
+        object.__setattr__(self, "variables", tuple(variables))
+        object.__setattr__(self, "rules", types.MappingProxyType(rules))      # a read-only view of the rules
+        object.__setattr__(self, "frozen_rules", tuple(sorted(rules.items())))
+        object.__setattr__(self, "table", Tree.compile_rules(constants, variables, rules))
+        # whether each ASCII code has a rule, to check the characters rewritten with the lookup table
+        has_rule = np.zeros(128, dtype=bool)
+        has_rule[[ord(c) for c in rules if c.isascii()]] = True
+        object.__setattr__(self, "has_rule", has_rule)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a Grammar cannot be changed, create a new one instead")
+
+    def __eq__(self, other):
+        return isinstance(other, Grammar) and self.axiom == other.axiom and self.frozen_rules == other.frozen_rules
+
+    def __hash__(self):
+        return hash((self.axiom, self.frozen_rules))
+
+    def __reduce__(self):
+        # grammars are pickled (e.g. to be sent to other processes) as the arguments that create them
+        return (Grammar, (self.axiom, self.constants, self.variables, dict(self.rules)))
+
+    def __repr__(self):
+        return "Grammar(axiom=" + repr(self.axiom) + ", rules=" + repr(dict(self.rules)) + ")"
+
+
+    def rewrite(self, start):
+        """This function computes one iteration of the grammar: each character of start (made only of symbols that have
+        a rule) is replaced by the output of its rule, with the lookup table, and without checking the rules again.
+        A character without a rule raises a KeyError, as a rules dictionary lookup would"""
+        if isinstance(self.table, dict):
+            missing = set(start).difference(self.rules)
+            if missing:
+                raise KeyError(min(missing))
+            return start.translate(self.table)
+
+        try:
+            codes = np.frombuffer(start.encode("ascii"), dtype=np.uint8)
+        except UnicodeEncodeError as error:
+            raise KeyError(start[error.start]) from None
+        # all characters are checked for a rule, then looked up in the table at once, then the zero bytes padding
+        # the rules' outputs are dropped
+        missing = ~self.has_rule[codes]
+        if missing.any():
+            raise KeyError(chr(codes[np.argmax(missing)]))
+        end = self.table[codes].tobytes().translate(None, b"\x00")
+        return end.decode("ascii")
+
+
+
+class StochasticGrammar():
+    """A stochastic L-system: a symbol can have several productions, each one chosen with a probability, so that trees
+    of the same species and age differ in shape. Rules are given as {symbol: output} for symbols with one production,
+    or {symbol: [(output, probability), ...]}, e.g. {"1": "11", "0": [("1[0]0", 0.6), ("1[0][0]0", 0.4)]}.
+    Like a Grammar, it is checked once, frozen, and hashable.
+    Trees are not expanded one by one: for each symbol and depth (number of years), a pool of pool_size expansions
+    (variants) is built once, each one made of a random production whose symbols point to random variants of the
+    depth below (see Tree.variant_pool). A tree is a random production of its axiom over these pools (see Tree.stochastic_rope),
+    so identical sub-derivations are stored once as shared rope nodes, and memory does not grow with the number of trees.
+    seed: the seed of the variants' and trees' random choices, the same seed always gives the same trees"""
+
+    __slots__ = ("axiom", "constants", "variables", "productions", "frozen_productions", "deterministic", "max_draws", "pool_size", "seed")
+
+    def __init__(self, axiom, constants, variables, rules, pool_size=16, seed=0):
+        productions = {}
+        for c, outputs in rules.items():
+            if isinstance(outputs, str):
+                outputs = [(outputs, 1)]
+            if abs(sum(probability for output, probability in outputs) - 1) > 1e-9:
+                raise ValueError("the probabilities of the productions of " + repr(c) + " do not add up to 1")
+            productions[c] = tuple((output, float(probability)) for output, probability in outputs)
+        for c in constants:
+            if c not in productions:
+                productions[c] = ((c, 1.0),)
+        # every symbol of every production must have a rule, like for deterministic grammars
+        Tree.input_check(constants, variables, {c: "".join(output for output, p in outputs) for c, outputs in productions.items()}, axiom=axiom)
+
+        # symbols whose expansion is the same in every tree (one production, made of such symbols only) need a single variant
+        deterministic = set()
+        changed = True
+        while changed:
+            changed = False
+            for c, outputs in productions.items():
+                if c not in deterministic and len(outputs) == 1 and all(s in deterministic or s == c for s in outputs[0][0]):
+                    deterministic.add(c)
+                    changed = True
+
+        object.__setattr__(self, "axiom", axiom)
+        object.__setattr__(self, "constants", tuple(constants))
+        object.__setattr__(self, "variables", tuple(variables))
+        object.__setattr__(self, "productions", types.MappingProxyType(productions))
+        object.__setattr__(self, "frozen_productions", tuple(sorted(productions.items())))
+        object.__setattr__(self, "deterministic", frozenset(deterministic))
+        # the random numbers needed by one expansion: one to choose the production, one per symbol of the longest output
+        object.__setattr__(self, "max_draws", 1 + max(len(output) for outputs in productions.values() for output, p in outputs))
+        object.__setattr__(self, "pool_size", pool_size)
+        object.__setattr__(self, "seed", seed)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a StochasticGrammar cannot be changed, create a new one instead")
+
+    def __eq__(self, other):
+        return (isinstance(other, StochasticGrammar) and self.axiom == other.axiom and self.frozen_productions == other.frozen_productions
+                and self.pool_size == other.pool_size and self.seed == other.seed)
+
+    def __hash__(self):
+        return hash((self.axiom, self.frozen_productions, self.pool_size, self.seed))
+
+    def __reduce__(self):
+        rules = {c: list(outputs) for c, outputs in self.productions.items()}
+        return (StochasticGrammar, (self.axiom, self.constants, self.variables, rules, self.pool_size, self.seed))
+
+    def __repr__(self):
+        return ("StochasticGrammar(axiom=" + repr(self.axiom) + ", rules=" + repr(dict(self.productions))
+                + ", pool_size=" + str(self.pool_size) + ", seed=" + str(self.seed) + ")")
+
+
+    def expand(self, symbol, draws, pools):
+        """This function builds one random expansion of symbol: a production of symbol is chosen with its probability,
+        and each of its symbols is replaced by a random variant of that symbol at the depth below.
+        draws: max_draws random numbers within [0, 1) (see Tree.stochastic_draws)
+        pools: the variants of the depth below of every symbol, {symbol: [nodes]}"""
+        outputs = self.productions[symbol]
+        # the production whose cumulative probability first exceeds the first draw (the last one, against rounding errors)
+        output = outputs[-1][0]
+        cumulative = 0
+        for candidate, probability in outputs:
+            cumulative += probability
+            if draws[0] < cumulative:
+                output = candidate
+                break
+        return TreeRope.concat(pools[s][int(draws[i + 1] * len(pools[s]))] for i, s in enumerate(output))
+
+
 
-    
-    
 # a more general superclass Tree, common to all species of trees, is defined
 
 class Tree():
     # every tree, regardless of the species has the same L-System scheme of growth
     # this means, that all species share the following attributes and funcions
-    all_apple_trees, all_pear_trees, all_plum_trees = orchard()
-    time_line =list(range(0,14)) # consider the orchard over 15 years for now 
-   
+    # the number of trees of each species is the one of the default orchard
+    all_apple_trees = OrchardAttribute("tree_counts", "AppleTree")
+    all_pear_trees = OrchardAttribute("tree_counts", "PearTree")
+    all_plum_trees = OrchardAttribute("tree_counts", "PlumTree")
+    time_line =list(range(0,14)) # consider the orchard over 15 years for now
+
+    # every tree string that has been generated is stored in the dictionary below, so that the same
+    # string is never derived twice: the keys are (grammar, year), see Grammar, and the values are
+    # the (immutable, hence shareable) strings
+    expansion_cache = {}
+
+    # the orchard used when no other orchard is given, created the first time it is needed (see default_orchard)
+    orchard_in_use = None
+
+    # the symbol counts of every tree string are stored in the same way (see symbol_counts)
+    count_cache = {}
+
+    # the directory of the memory-mapped tree strings (see mapped_string), None for a folder of the temporary directory
+    mapped_directory = None
+
+    # the rope expansions of every grammar (see grammar_rope), keyed by grammar
+    rope_cache = {}
+
+    # the grammars created from loose axioms, constants, variables and rules (see cached_grammar), so that each one is checked once
+    grammars = {}
+
+    # the deterministic part of every (species, age) cohort of trees that has been computed (see cohort)
+    cohort_cache = {}
+
+    # a disk cache of harvest matrices used by species_harvest, if any (see orchard_cache.enable)
+    result_cache = None
+
+    # the shared sub-derivations of every stochastic grammar (see variant_pool), keyed by grammar:
+    # {grammar: {depth: {symbol: [variants]}}}
+    variant_pools = {}
+
+
+    def default_orchard():
+        """This function returns the orchard in use, creating an Orchard (from the random module) if there is none yet"""
+        if Tree.orchard_in_use is None:
+            Tree.orchard_in_use = Orchard()
+        return Tree.orchard_in_use
+
+
+    def use_orchard(new_orchard):
+        """This function sets the orchard in use, whose tree counts and species characteristics become the default ones"""
+        Tree.orchard_in_use = new_orchard
+
 
     def rules_setup(constants, rules):
         """This function adds all constants' associated rules to the rules dictionary"""
@@ -106,35 +752,272 @@ class Tree():
         return rules[start]
     
     
+    def compile_rules(constants, variables, rules):
+        """This function compiles a rules dictionary into a lookup table that rewrites a whole string in one bulk operation.
+        Row i of the table holds the output of the rule whose input is the character with code i, padded with zero bytes
+        up to the length of the longest output (rows of characters without a rule are empty, see Grammar.has_rule).
+        Rules that are not pure ASCII are compiled into a str.translate table instead.
+        The rules must be set up and checked already: each Grammar compiles its rules once, when it is created"""
+
+        symbols = "".join(rules) + "".join(rules.values())
+        if symbols.isascii() and "\x00" not in symbols:
+            table = np.zeros((128, max(len(new_string) for new_string in rules.values())), dtype=np.uint8)
+            for c, new_string in rules.items():
+                table[ord(c), :len(new_string)] = np.frombuffer(new_string.encode("ascii"), dtype=np.uint8)
+        else:
+            table = str.maketrans(rules)
+        return table
+
+
+    def cached_grammar(axiom, constants, variables, rules):
+        """This function returns the Grammar of an axiom, constants, variables and rules. The grammar of the same arguments
+        is created (and checked) only once, then taken from Tree.grammars; the rules dictionary given is never changed.
+        axiom: can be None, for grammars that only rewrite strings (see ith_iteration)"""
+        key = (axiom, tuple(constants), tuple(variables), tuple(sorted(rules.items())))
+        if key not in Tree.grammars:
+            Tree.grammars[key] = Grammar(axiom, constants, variables, rules)
+        return Tree.grammars[key]
+
+
     def ith_iteration(start, constants, variables, rules):
         """This function computes one iteration for the generation of an L-system:
-        start: an initial string, representative of the tree state
+        start: an initial string, representative of the tree state, made only of symbols that have a rule
         end: the new returned string, where each character was changed using the Rules dictionary"""
-
-        Tree.input_check(constants, variables, rules)
-
-        end = "" # because any character can be stored in a string, unlike lists, sets...
-        for c in start:   # start will always have to be a string after the first iteration
-            end += rules[c]
-        return end
+        return Tree.cached_grammar(None, constants, variables, rules).rewrite(start)
     
     
-    def tree_string(axiom, constants, variables, rules, years):
+    def tree_string(axiom, constants, variables, rules, years, mapped=False):
         """This function generates the string representing a fractal tree
-        at a specified time (years)"""
-        Tree.rules_setup(constants, rules)
-        newstring = Tree.first_iteration(axiom, constants, variables, rules)
+        at a specified time (years), see grammar_string.
+        mapped: if True, the string is written to a file and returned as a MappedTreeString (see mapped_string),
+        for strings too large for the memory"""
+        if mapped:
+            return Tree.mapped_string(Tree.cached_grammar(axiom, constants, variables, rules), years)
+        return Tree.grammar_string(Tree.cached_grammar(axiom, constants, variables, rules), years)
+
+
+    def grammar_string(grammar, years):
+        """This function generates the string of a Grammar at a specified time (years).
+        Strings are cached per grammar and year (see expansion_cache): the string of year n is derived
+        from the latest cached year before n, and one shared string is returned to every caller"""
+        if (grammar, years) in Tree.expansion_cache:
+            return Tree.expansion_cache[(grammar, years)]
+
         if years == 0:
-            return axiom
-        if years == 1:
-            return newstring
+            Tree.expansion_cache[(grammar, 0)] = grammar.axiom
+            return grammar.axiom
 
+        # restart from the most recent generation already in the cache, if any
+        newstring = grammar.rules[grammar.axiom]
         year = 1
+        for cached_year in range(years - 1, 1, -1):
+            if (grammar, cached_year) in Tree.expansion_cache:
+                newstring = Tree.expansion_cache[(grammar, cached_year)]
+                year = cached_year
+                break
+        Tree.expansion_cache[(grammar, year)] = newstring
+
         while year < years:
-            newstring = Tree.ith_iteration(newstring, constants, variables, rules)
+            newstring = grammar.rewrite(newstring)
             year += 1
+            Tree.expansion_cache[(grammar, year)] = newstring
 
         return newstring
+
+
+    def mapped_folder(directory=None):
+        """This function returns the directory of the memory-mapped tree strings: directory, else Tree.mapped_directory,
+        else the folder orchard_strings of the temporary directory"""
+        if directory is None:
+            directory = Tree.mapped_directory
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), "orchard_strings")
+        return directory
+
+
+    def mapped_path(grammar, years, directory=None):
+        """This function returns the path of the file of the string of a Grammar at a specified time (years), see mapped_string.
+        Files are named by a hash of the grammar (stable across runs, unlike python's hash) and the year"""
+        name = hashlib.sha256(repr((grammar.axiom, grammar.frozen_rules)).encode()).hexdigest()[:16]
+        return os.path.join(Tree.mapped_folder(directory), name + "-" + str(years) + ".bin")
+
+
+    def mapped_string(grammar, years, directory=None):
+        """This function generates the string of a Grammar at a specified time (years), like grammar_string, but streams
+        each generation to a file: the string of a year is read (memory-mapped) block by block from the file of the
+        previous year, and each block is rewritten (see Grammar.rewrite) and appended to the file of the year, so no
+        whole generation is ever in memory. Only the file of the last year is kept; later calls (of any process) find it
+        again, and restart from the most recent year already on disk.
+        Files are written under a temporary name and renamed when complete, so a file is never read half-written.
+        directory: where the files are written, see mapped_folder
+        It returns a MappedTreeString"""
+        path = Tree.mapped_path(grammar, years, directory)
+        if os.path.exists(path):
+            return MappedTreeString.open(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # restart from the most recent generation already on disk, if any
+        previous = MappedTreeString(np.frombuffer(grammar.axiom.encode("ascii"), dtype=np.uint8))
+        year = 0
+        for cached_year in range(years - 1, 0, -1):
+            if os.path.exists(Tree.mapped_path(grammar, cached_year, directory)):
+                previous = MappedTreeString.open(Tree.mapped_path(grammar, cached_year, directory))
+                year = cached_year
+                break
+
+        temporary_path = None
+        while year < years:
+            handle, next_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".bin")
+            with os.fdopen(handle, "wb") as string_file:
+                for chunk in previous.iter_chunks():
+                    string_file.write(grammar.rewrite(chunk).encode("ascii"))
+            # the intermediate generation is dropped as soon as the next one is written
+            if temporary_path is not None:
+                os.remove(temporary_path)
+            temporary_path = next_path
+            previous = MappedTreeString.open(temporary_path)
+            year += 1
+
+        # the string of year 0 is the axiom itself
+        if temporary_path is None:
+            handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".bin")
+            with os.fdopen(handle, "wb") as string_file:
+                string_file.write(grammar.axiom.encode("ascii"))
+        os.replace(temporary_path, path)
+        return MappedTreeString.open(path)
+
+
+    def clear_mapped_strings(directory=None):
+        """This function removes the files of the memory-mapped tree strings (see mapped_string); strings still in use
+        stay readable until they are dropped. Files still being written (by any process) are left alone"""
+        directory = Tree.mapped_folder(directory)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".bin") and not name.startswith(".tmp-"):
+                    os.remove(os.path.join(directory, name))
+
+
+    def clear_expansion_cache():
+        """This function empties the cache of generated tree strings, e.g. to free memory after a long horizon run"""
+        Tree.expansion_cache.clear()
+        Tree.count_cache.clear()
+        Tree.rope_cache.clear()
+        Tree.cohort_cache.clear()
+        Tree.variant_pools.clear()
+
+
+    def tree_rope(axiom, constants, variables, rules, years):
+        """This function generates the tree string of a specified time (years), like tree_string, but as a TreeRope,
+        see grammar_rope"""
+        return Tree.grammar_rope(Tree.cached_grammar(axiom, constants, variables, rules), years)
+
+
+    def grammar_rope(grammar, years):
+        """This function generates the string of a Grammar at a specified time (years), like grammar_string, but as a TreeRope.
+        All ropes of the same grammar share their nodes, so memory grows with the number of years instead of with
+        the length of the strings: this is the representation to use for long horizons (30-75 years)"""
+        if grammar not in Tree.rope_cache:
+            Tree.rope_cache[grammar] = {}
+        return TreeRope.from_rules(grammar.axiom, grammar.rules, years, Tree.rope_cache[grammar])
+
+
+    def symbol_counts(axiom, constants, variables, rules, years):
+        """This function computes how many times each symbol occurs in the tree string at a specified time (years),
+        without generating the string itself, see grammar_counts"""
+        return Tree.grammar_counts(Tree.cached_grammar(axiom, constants, variables, rules), years)
+
+
+    def grammar_counts(grammar, years):
+        """This function computes how many times each symbol occurs in the string of a Grammar at a specified time (years),
+        without generating the string itself.
+        Every year each symbol c is replaced by rules[c], so the counts of year n+1 follow from the counts of year n:
+        count[s] at year n+1 = sum over c of count[c] at year n * (occurrences of s in rules[c]).
+        It returns a dictionary {symbol: count}; counts are python integers, so they never overflow, even at year 75"""
+        if (grammar, years) in Tree.count_cache:
+            return Tree.count_cache[(grammar, years)]
+
+        # restart from the most recent year already in the cache, if any
+        year = 0
+        counts = {}
+        for c in grammar.axiom:
+            counts[c] = counts.get(c, 0) + 1
+        for cached_year in range(years - 1, 0, -1):
+            if (grammar, cached_year) in Tree.count_cache:
+                counts = Tree.count_cache[(grammar, cached_year)]
+                year = cached_year
+                break
+        Tree.count_cache[(grammar, year)] = counts
+
+        # the rule matrix: for each input symbol, how many times each symbol appears in its output
+        rule_matrix = {}
+        for c, new_string in grammar.rules.items():
+            rule_matrix[c] = {}
+            for s in new_string:
+                rule_matrix[c][s] = rule_matrix[c].get(s, 0) + 1
+
+        while year < years:
+            new_counts = {}
+            for c, n in counts.items():
+                for s, m in rule_matrix[c].items():
+                    new_counts[s] = new_counts.get(s, 0) + n * m
+            counts = new_counts
+            year += 1
+            Tree.count_cache[(grammar, year)] = counts
+
+        return counts
+
+
+    def variant_pool(grammar, depth):
+        """This function returns the variants of every symbol of a StochasticGrammar after depth years, as {symbol: [nodes]}.
+        The pools are built once, depth by depth, and kept in variant_pools: the variants of depth d are built from the
+        ones of depth d - 1, so pools of all depths share their nodes, and memory grows with depth * pool_size only.
+        Each variant only depends on the grammar's seed, its symbol, depth and index (see stochastic_draws)"""
+        if grammar not in Tree.variant_pools:
+            Tree.variant_pools[grammar] = {0: {c: [c] for c in grammar.productions}}
+        pools = Tree.variant_pools[grammar]
+
+        for d in range(max(pools) + 1, depth + 1):
+            pools[d] = {}
+            for c in grammar.productions:
+                n_variants = 1 if c in grammar.deterministic else grammar.pool_size
+                # variants are numbered k + (symbol code << 32), so that each symbol has its own random numbers
+                draws = Tree.stochastic_draws(grammar, 0, np.arange(n_variants) + (ord(c) << 32), d)
+                pools[d][c] = [grammar.expand(c, draws[k], pools[d - 1]) for k in range(n_variants)]
+        return pools[depth]
+
+
+    def stochastic_draws(grammar, stream, ids, depth):
+        """This function draws the random numbers of expansions of a StochasticGrammar: one row of max_draws numbers
+        within [0, 1) for each id (a variant, or a tree), at a given depth. Like harvest_draws, they are counter-based
+        (see philox4x32), keyed by the grammar's seed and the stream (0 for the variants, 1 for the trees), so they
+        only depend on the seed, id and depth, and the rows of many ids are drawn at once"""
+        key = np.random.SeedSequence([grammar.seed, stream]).generate_state(2, dtype=np.uint32)
+        ids = np.asarray(ids, dtype=np.uint64)[:, None]
+        counter = (ids & np.uint64(0xFFFFFFFF), ids >> np.uint64(32), depth, np.arange(grammar.max_draws, dtype=np.uint64)[None, :])
+        return philox4x32(counter, key)[0] / 2.0**32
+
+
+    def stochastic_ropes(grammar, years, tree_ids):
+        """This function generates the strings of the given trees (tree ids) of a StochasticGrammar at a specified time
+        (years), as a list of TreeRope: each one is a random production of the axiom, whose symbols are random variants
+        of the pools of years - 1 (see variant_pool). The choices of a tree only depend on the seed, the tree id and
+        the years, and only its top node is its own: the rest is shared with the other trees"""
+        if years == 0:
+            return [TreeRope(grammar.axiom) for tree_id in tree_ids]
+        pools = Tree.variant_pool(grammar, years - 1)
+        draws = Tree.stochastic_draws(grammar, 1, tree_ids, years)
+        return [TreeRope(grammar.expand(grammar.axiom, row, pools)) for row in draws.tolist()]
+
+
+    def stochastic_rope(grammar, years, tree_id):
+        """This function generates the string of one tree (tree_id) of a StochasticGrammar at a specified time (years),
+        as a TreeRope (see stochastic_ropes)"""
+        return Tree.stochastic_ropes(grammar, years, [tree_id])[0]
+
+
+    def count_branches(t_string):
+        """This function counts the branches of a tree string, i.e. the number of "0" tips in it"""
+        return t_string.count("0")
     
  
     def iterate_years(year_n): 
@@ -142,53 +1025,257 @@ class Tree():
         return iterate_years
         
     
-    def species_harvest(species):
-        """This takes as input a species name, and returns a dataframe containing on each row one tree's fruits that
-        were produced across all the orchard's timeline."""
-        
+    def species_class(species):
+        """This function returns the class of a species name: "AppleTree", "PearTree" or "PlumTree".
+        A species class is returned as it is; any other name raises a ValueError"""
+        if isinstance(species, type) and issubclass(species, Tree):
+            return species
         if species == "AppleTree":
-            # the total number of trees to generate is determined
-            # this number is calculated based on the land proportion allocated to apple trees
-            tot_n_trees = Tree.all_apple_trees
-            
-            # the apple_tree dataframe is generated having the fruits produced by each tree across multiple years as the dataframe's rows
-            # years of the orchard are represented as columns, instead
-            apple_orchard_df = pd.DataFrame(index = list(range(tot_n_trees)) )
-            for year_n in range(len(Tree.time_line)):
-                AppleTree.generate_trees( tot_n_trees, year_n)
-
-                for tree_n in range(len(AppleTree.instances)):
-                    apple_orchard_df.loc[ tree_n, Tree.iterate_years(year_n) ] = AppleTree.instances[tree_n].fruits
-            
-            # a column totals returns for each tree its total number of apples yielded over its whole life
-            apple_orchard_df['Total'] = apple_orchard_df.sum(axis=1)
-            return apple_orchard_df
-
+            return AppleTree
         elif species == "PearTree":
-            tot_n_trees = Tree.all_pear_trees
-            pear_orchard_df = pd.DataFrame(index = list(range(tot_n_trees)) )
+            return PearTree
+        elif species == "PlumTree":
+            return PlumTree
+        raise ValueError("unknown species: " + repr(species) + ", use one of " + str(TreeStore.species_names))
+
+
+    def cohort(species_class, tree_age, overrides=None):
+        """This function computes what all trees of a species planted at the same time (a cohort) share at a given age:
+        their tree string, number of branches and the disease effect, which do not depend on the tree.
+        It is computed once for each species and age, then taken from cohort_cache (the key also holds the species
+        parameters it depends on, so changing them gives a new cohort); only the harvest draw differs between trees.
+        It returns a dictionary with "string" (a TreeRope, see grammar_rope), "branch_count" (the exact number of "0" tips),
+        "harvest_divisor" (the number of branches the harvest is averaged over when the disease removes fruits, else 1)
+        and "n_affected_branches" (the number of branches affected by the disease).
+        overrides: species parameters to use instead of the class attributes, see species_parameter"""
+
+        high = species_class.harvest_range[1]
+        key = (species_class.grammar, tree_age, Tree.species_parameter(species_class, "disease_threshold", overrides),
+               Tree.species_parameter(species_class, "disease_severity", overrides), high)
+        if key in Tree.cohort_cache:
+            return Tree.cohort_cache[key]
+
+        n_branches = Tree.grammar_counts(species_class.grammar, tree_age).get("0", 0)
+        harvest_divisor, n_affected_branches = Tree.disease_factors(species_class, n_branches, tree_age, overrides)
+
+        Tree.cohort_cache[key] = {"string": Tree.grammar_rope(species_class.grammar, tree_age),
+                                  "branch_count": n_branches,
+                                  "harvest_divisor": int(harvest_divisor),
+                                  "n_affected_branches": int(n_affected_branches)}
+        return Tree.cohort_cache[key]
+
+
+    def species_parameter(species_class, parameter, overrides=None):
+        """This function returns a parameter of a species (e.g. "disease_severity"): the value given in overrides, a
+        dictionary {parameter: value} (e.g. the point of a parameter sweep), else the species' class attribute"""
+        if overrides is not None and parameter in overrides:
+            return overrides[parameter]
+        return getattr(species_class, parameter)
+
+
+    def disease_factors(species_class, n_branches, tree_ages, overrides=None):
+        """This function computes the effect of the disease on trees of a species, from their number of branches and age:
+        the number of branches the harvest is averaged over when the disease removes fruits (else 1), and the number
+        of branches affected by the disease (see cohort, and the *_per_year functions).
+        n_branches, tree_ages: numbers, or arrays broadcast against each other
+        overrides: species parameters to use instead of the class attributes, see species_parameter
+        It returns two arrays: harvest_divisor (float) and n_affected_branches (int)"""
+        high = species_class.harvest_range[1]
+        # once a tree has more than twice as many branches as fruits, the average harvest per branch rounds
+        # to 0 and the disease cannot remove any fruit anymore (capping the count also keeps huge counts out of int64)
+        if isinstance(n_branches, int):
+            n_branches = min(n_branches, 2 * high)
+        n_branches = np.asarray(n_branches, dtype=np.int64)
+        disease_threshold = Tree.species_parameter(species_class, "disease_threshold", overrides)
+        disease_severity = Tree.species_parameter(species_class, "disease_severity", overrides)
+        diseased = (np.asarray(tree_ages) >= disease_threshold) & (n_branches < 2 * high)
+        harvest_divisor = np.where(diseased, n_branches, 1).astype(float)
+        n_affected_branches = np.where(diseased, np.round(n_branches / (11 - disease_severity)), 0).astype(np.int64)
+        return harvest_divisor, n_affected_branches
+
+
+    def year_factors(species_class, years, maturation_threshold, overrides=None):
+        """This function computes the deterministic part of the harvest of a species, for each of the given years (tree ages):
+        whether trees are mature, their number of branches, and the number of branches affected by the disease.
+        Each distinct age is computed once (see cohort), whatever the number of trees and years asked for.
+        overrides: species parameters to use instead of the class attributes, see species_parameter
+        It returns three arrays, with one entry per year: mature (bool), branch_count (float) and n_affected_branches (int)"""
+        years = np.asarray(years)
+        cohorts = [Tree.cohort(species_class, int(year_n), overrides) for year_n in years]
+        branch_count = np.array([cohort["harvest_divisor"] for cohort in cohorts], dtype=float)
+        n_affected_branches = np.array([cohort["n_affected_branches"] for cohort in cohorts], dtype=np.int64)
+
+        # trees that are not mature yet do not bear any fruit
+        mature = years >= maturation_threshold
+        return mature, branch_count, n_affected_branches
+
+
+    def harvest_draws(species_class, seed, tree_ids, years):
+        """This function draws the raw harvest (before maturation and disease) of the given trees in the given years.
+        Draws come from a counter-based generator (see philox4x32), keyed by the seed, with the species, tree id and year
+        as counter: each draw only depends on (seed, species, tree_id, year), so any cell of the harvest matrix can be
+        computed on its own, in any order, and chunks of trees or years can be computed in parallel.
+        tree_ids, years: arrays broadcast against each other (e.g. a column of tree ids and a row of years give a matrix)"""
+
+        key = np.random.SeedSequence(seed).generate_state(2, dtype=np.uint32)
+        tree_ids = np.asarray(tree_ids, dtype=np.uint64)
+        species_index = TreeStore.species_names.index(species_class.__name__)
+        counter = (tree_ids & np.uint64(0xFFFFFFFF), tree_ids >> np.uint64(32), np.asarray(years, dtype=np.uint64), species_index)
+        bits = philox4x32(counter, key)[0]
+
+        # 32 random bits are mapped onto the harvest range by multiplication (a bias below 1e-7 for these ranges)
+        low, high = species_class.harvest_range
+        return (low + ((bits * np.uint64(high - low + 1)) >> np.uint64(32))).astype(np.int64)
+
+
+    def harvest_matrix(species_class, tot_n_trees=None, rng=None, orchard=None, tree_ids=None, years=None, branch_counts=None, overrides=None):
+        """This function computes, in one batch, the fruits produced by tot_n_trees trees of a species across all the
+        orchard's timeline. It returns an integer array with one row per tree and one column per year.
+        The steps are the ones of the *_per_year functions, applied to whole arrays: one harvest is drawn for
+        every tree and year, then the maturation and disease effects of each year are applied to its column.
+        rng: a numpy random Generator to draw the harvests from; by default draws are counter-based (see harvest_draws),
+        keyed by the orchard's seed
+        orchard: the Orchard to harvest, by default the default orchard (with the maturation thresholds of the class attributes)
+        tree_ids, years: the trees and years to compute (by default 0, 1, ..., tot_n_trees-1 and the whole time line),
+        so that any part of the matrix can be computed on its own.
+        Trees planted after year 0 (see Orchard.add_planting) are as old as the years since their planting, and bear no
+        fruit before it: the maturation and disease effects are computed once for each distinct age, and shared by all
+        the cohorts of trees reaching that age.
+        branch_counts: the number of branches of each tree (one entry per tree), for trees whose shape is not the one of
+        the species' grammar (see generate_stochastic_trees): the disease effect then follows each tree's own branches
+        overrides: species parameters to use instead of the class attributes (e.g. {"disease_severity": 7}), see species_parameter"""
+
+        if orchard is None:
+            maturation_threshold = species_class.maturation_threshold
+            orchard = Tree.default_orchard()
+        else:
+            maturation_threshold = orchard.maturation_thresholds[species_class.__name__]
+        if tree_ids is None:
+            tree_ids = np.arange(tot_n_trees)
+        if years is None:
+            years = np.arange(len(Tree.time_line))
+        tree_ids = np.asarray(tree_ids)
+        years = np.asarray(years)
+
+        # the age of each tree in each year, from the year its cohort was planted (negative before it is planted)
+        ages = years[None, :] - orchard.planting_years(species_class.__name__, tree_ids)[:, None]
+        planted = ages >= 0
+        ages = np.maximum(ages, 0)
+        # the factors are computed for each distinct age, then looked up for every tree and year
+        mature, branch_count, n_affected_branches = Tree.year_factors(species_class, np.arange(ages.max(initial=0) + 1), maturation_threshold, overrides)
+        mature, branch_count, n_affected_branches = mature[ages] & planted, branch_count[ages], n_affected_branches[ages]
+        if branch_counts is not None:
+            branch_count, n_affected_branches = Tree.disease_factors(species_class, np.asarray(branch_counts)[:, None], ages, overrides)
+
+        if rng is None:
+            harvest = Tree.harvest_draws(species_class, orchard.seed, tree_ids[:, None], years[None, :])
+        else:
+            low, high = species_class.harvest_range
+            harvest = rng.integers(low, high + 1, size=(len(tree_ids), len(years)))
+        avg_harvest_per_branch = np.round(harvest / branch_count).astype(np.int64)
+        harvest = (harvest - n_affected_branches * avg_harvest_per_branch) * mature
+        return harvest
 
-            for year_n in range(len(Tree.time_line)):
-                PearTree.generate_trees( tot_n_trees, year_n)
 
-                for tree_n in range(len(PearTree.instances)):
-                    pear_orchard_df.loc[ tree_n, Tree.iterate_years(year_n) ] = PearTree.instances[tree_n].fruits
+    def tree_harvest(species, tree_id, year, orchard=None):
+        """This function computes the fruits of a single tree (tree_id) of a species in a single year, without
+        computing any other tree or year: it is equal to the matching cell of species_harvest"""
+        return int(Tree.harvest_matrix(Tree.species_class(species), orchard=orchard, tree_ids=[tree_id], years=[year])[0, 0])
 
-            pear_orchard_df['Total'] = pear_orchard_df.sum(axis=1)
-            return pear_orchard_df
 
+    def species_tree_count(species, orchard=None):
+        """This function returns the number of trees of a species in an orchard (by default, the Tree class attributes)"""
+        if orchard is not None:
+            return orchard.tree_counts[Tree.species_class(species).__name__]
+        elif species == "AppleTree":
+            return Tree.all_apple_trees
+        elif species == "PearTree":
+            return Tree.all_pear_trees
         else:
-            tot_n_trees = Tree.all_plum_trees
-            plum_orchard_df = pd.DataFrame(index = list(range(tot_n_trees)) )
+            return Tree.all_plum_trees
+
+
+    def generate_orchard_trees(species, year, orchard=None):
+        """This function generates the tree instances of a species standing in the orchard in a given year of the time line,
+        like generate_trees, but for all the cohorts planted up to that year (see Orchard.add_planting), each one at its own age.
+        Trees of the same age share one cohort (see cohort), whatever the number of plantings; fruits are the ones of
+        species_harvest for that year. The trees are stored in the instances store of the species, with their tree ids"""
+
+        species_class = Tree.species_class(species)
+        plantings = (Tree.default_orchard() if orchard is None else orchard).plantings[species_class.__name__]
+        species_class.instances.clear()
+
+        first_id = 0
+        for planting_year, n_trees in plantings:
+            if planting_year <= year and n_trees > 0:
+                tree_ids = np.arange(first_id, first_id + n_trees)
+                fruits = Tree.harvest_matrix(species_class, orchard=orchard, tree_ids=tree_ids, years=[year])[:, 0]
+                tree_age = year - planting_year
+                species_class.instances.fill(species_class.__name__, tree_age, fruits, Tree.cohort(species_class, tree_age)["string"], tree_ids)
+            first_id += n_trees
+
+
+    def generate_stochastic_trees(species, grammar, tree_n, tree_age, orchard=None):
+        """This function generates tree_n trees of a species at a given age, like generate_trees, but each tree grows
+        its own string from a StochasticGrammar (see stochastic_rope); the strings share their sub-derivations.
+        Fruits are drawn like the ones of species_harvest for that year, but the disease effect follows the number of
+        branches ("0" tips) of each tree's own string"""
+        species_class = Tree.species_class(species)
+        species_class.instances.clear()
+        strings = Tree.stochastic_ropes(grammar, tree_age, np.arange(tree_n))
+        branch_counts = [tree_string.count("0") for tree_string in strings]
+        fruits = Tree.harvest_matrix(species_class, tree_n, orchard=orchard, years=[tree_age], branch_counts=branch_counts)[:, 0]
+        species_class.instances.fill(species_class.__name__, tree_age, fruits, strings)
+
+
+    def iter_harvest(species, chunk_size=100000, orchard=None, tot_n_trees=None):
+        """This function yields the harvest of a species chunk by chunk of trees, as (tree_ids, harvest) pairs, where
+        harvest is an integer array with one row per tree of the chunk and one column per year (as in harvest_matrix).
+        Only one chunk is in memory at a time, whatever the number of trees and years, so the stream can be consumed
+        incrementally (e.g. aggregated, or written to a file) even when the whole matrix would not fit in memory.
+        tot_n_trees: the number of trees to harvest, by default the number of trees of the species in the orchard"""
+
+        species_class = Tree.species_class(species)
+        if tot_n_trees is None:
+            tot_n_trees = Tree.species_tree_count(species, orchard)
+
+        for start in range(0, tot_n_trees, chunk_size):
+            tree_ids = np.arange(start, min(start + chunk_size, tot_n_trees))
+            yield tree_ids, Tree.harvest_matrix(species_class, orchard=orchard, tree_ids=tree_ids)
+
+
+    def yearly_totals(species, chunk_size=100000, orchard=None, tot_n_trees=None):
+        """This function returns the total harvest of a species in each year, summed over all its trees.
+        It consumes the stream of iter_harvest, so its memory use does not grow with the number of trees"""
+        totals = np.zeros(len(Tree.time_line), dtype=np.int64)
+        for tree_ids, harvest in Tree.iter_harvest(species, chunk_size, orchard, tot_n_trees):
+            totals += harvest.sum(axis=0)
+        return totals
+
+
+    def species_harvest(species, rng=None, orchard=None):
+        """This takes as input a species name, and returns a dataframe containing on each row one tree's fruits that
+        were produced across all the orchard's timeline.
+        The fruits are computed for all trees and years at once (see harvest_matrix), and the dataframe is built in one go.
+        orchard: the Orchard to harvest, by default the one given by the Tree class attributes (see default_orchard)"""
+        
+        # the total number of trees to generate is determined
+        # this number is calculated based on the land proportion allocated to the species
+        tot_n_trees = Tree.species_tree_count(species, orchard)
 
-            for year_n in range(len(Tree.time_line)):
-                PlumTree.generate_trees( tot_n_trees, year_n)
+        # with counter-based draws, the same orchard always gives the same matrix, which can be read from the disk cache
+        if rng is None and Tree.result_cache is not None:
+            harvest = Tree.result_cache.harvest_matrix(Tree.species_class(species), tot_n_trees, orchard)
+        else:
+            harvest = Tree.harvest_matrix(Tree.species_class(species), tot_n_trees, rng, orchard)
 
-                for tree_n in range(len(PlumTree.instances)):
-                    plum_orchard_df.loc[ tree_n, Tree.iterate_years(year_n) ] = PlumTree.instances[tree_n].fruits
+        # the dataframe has the fruits produced by each tree across multiple years as rows
+        # years of the orchard are represented as columns, instead
+        orchard_df = pd.DataFrame(harvest, columns=[Tree.iterate_years(year_n) for year_n in range(len(Tree.time_line))])
 
-            plum_orchard_df['Total'] = plum_orchard_df.sum(axis=1)
-            return plum_orchard_df
+        # a column totals returns for each tree its total number of fruits yielded over its whole life
+        orchard_df['Total'] = harvest.sum(axis=1)
+        return orchard_df
     
     
     
@@ -201,19 +1288,26 @@ class AppleTree(Tree):
     constants = ["[","]"]                       # a list because it's mutable
     variables = ["0","1"]
     rules = {"1":"11", "0":"1[0]0"}
-    maturation_threshold = random.uniform(4, 5) # apple trees start to bear fruit 4-5 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    grammar = Grammar(axiom, constants, variables, rules) # the checked and frozen L-system above, used to generate the trees (see Grammar)
+    maturation_range = (4, 5)                   # apple trees start to bear fruit 4-5 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    maturation_threshold = OrchardAttribute("maturation_thresholds") # drawn within maturation_range for each orchard (see Orchard)
     disease_threshold = 9                       # the year number at which a disease starts affecting some tree branches
     disease_severity = 6                         # this number, within the [1,10] range, represents the severity level of the disease - highest for apples, then plums, then pairs based on literature (https://ptes.org/campaigns/traditional-orchard-project/orchard-practical-guides/fruit-tree-health/orchard-fruit-tree-diseases/)
                                                 # it can be an integer or float, the higher it is, the more branches are affected
-    apple_form = random.randrange(30,45)        # determine the form of the apple tree based off literature (https://douglas.extension.wisc.edu/files/2015/05/Training-and-Pruning-Apple-Trees.pdf)
+    form_range = (30, 45)                       # determine the form of the apple tree based off literature (https://douglas.extension.wisc.edu/files/2015/05/Training-and-Pruning-Apple-Trees.pdf)
+    apple_form = OrchardAttribute("forms")      # drawn within form_range for each orchard (see Orchard)
+    harvest_range = (80, 150)                   # the range of apples harvested per year on one mature tree, see the literature and computation further below
+    colors = {"0": "red", "1": "brown"}         # drawing colours of the tips ("0") and of the branches ("1")
+    segment_lengths = {"0": (20, 140), "1": (5, 60)} # ranges of the drawing lengths of the tips and of the branches
+    trunk_length = (10, 90)                     # range of the drawing length of the trunk, the axiom's upright stick
     
-    # the "instances" list below keeps track of all instances that will be generated
-    instances = []
+    # the "instances" store below keeps track of all instances that will be generated
+    instances = TreeStore()
     
     
     def __init__(self, idnr, string, fruits=None):
         """This initializes any instance of an AppleTree, namely, we define the
-        attributes of each specific and unique apple tree; It also registers it in the "instances" list"""
+        attributes of each specific and unique apple tree; It also registers it in the "instances" store"""
         self.id = idnr
         self.string = string
         self.fruits = fruits
@@ -221,7 +1315,7 @@ class AppleTree(Tree):
        
     
     def __str__(self):
-        return "AppleTree nr.: "+ str(self.id) +" with tree string: "+ self.string + "and nr. of fruits: "+ str(self.fruits)
+        return "AppleTree nr.: "+ str(self.id) +" with tree string: "+ str(self.string) + "and nr. of fruits: "+ str(self.fruits)
     
     
     # (https://harvesttotable.com/how_to_grow_apples/#:~:text=Apples%20can%20grow%20from%2010,harvest%20depending%20upon%20the%20variety.)
@@ -237,22 +1331,24 @@ class AppleTree(Tree):
     # conversely, if one and one only apple were present at each tip, as the tree grows over time, apples would increase exponentially and more unrealistically
    
 
-    def apples_per_year(year, t_string):
-        """calculate how many apples per year are generated on a single tree over the given time line"""
+    def apples_per_year(year, t_string=None):
+        """calculate how many apples per year are generated on a single tree over the given time line
+        t_string: the tree string at that year; if it is not given, the branches are counted from the AppleTree rules
+        (see Tree.symbol_counts) without generating the string"""
 
         if year < AppleTree.maturation_threshold:
             harvest = 0
 
         else:
-            harvest = random.randint(80,150)
+            harvest = random.randint(*AppleTree.harvest_range)
             
             #count the number of branches (where we define a branch as a part of the tree that starts from the first bifurcation
             #and terminate in its own unique tip). This definition is operational rather than conceptual, because it allows to 
             #univoquely identify each branch by their unique tip, which is characterized by a "0" in the tree string.
-            branch_count = 0
-            for c in t_string:
-                if c =="0":
-                    branch_count += 1
+            if t_string is None:
+                branch_count = Tree.grammar_counts(AppleTree.grammar, year).get("0", 0)
+            else:
+                branch_count = Tree.count_branches(t_string)
             avg_harvest_per_branch = round(harvest/branch_count)
             
             if year >= AppleTree.disease_threshold:
@@ -266,21 +1362,21 @@ class AppleTree(Tree):
         """This function generates multiple apple tree instances of a desired age.
         tree_n: number of apple tree instances to generate
         tree_age: age of each apple tree instance generated
-        apple tree variable names: at0, at1, ..., atN where N = tree_n-1"""
+        the apple trees are stored in AppleTree.instances (a TreeStore), with ids 0, 1, ..., N where N = tree_n-1"""
         
-        # empty the Apple Tree instances list from possible previous instantiations
-        AppleTree.instances = []
+        # empty the Apple Tree instances store from possible previous instantiations
+        AppleTree.instances.clear()
 
-        for i in range(tree_n):
-            # generate each tree's string, at the specified age
-            at_string = Tree.tree_string(AppleTree.axiom, AppleTree.constants, AppleTree.variables, AppleTree.rules, tree_age)             
-            
-            # calculate for each tree, the number of apples it has, at the specified age
-            at_fruits = AppleTree.apples_per_year(tree_age, at_string)
-            
-            # generate each tree instance with their (1) idnr, (2) tree string and (3) nr of fruits, and store it in a variable 
-            # note: their names will be at0, at1, ..., atN where N is the specified tree_n-1
-            globals()["at" + str(i)] = AppleTree(i, at_string, at_fruits)
+        # the string, branch count and disease effect are the same for all trees of that age, so they are computed once
+        # (see Tree.cohort): the string is a rope shared by all trees of that age, so no tree holds its own copy of it
+        at_cohort = Tree.cohort(AppleTree, tree_age)
+
+        # calculate for each tree, the number of apples it has, at the specified age: the harvests of all trees
+        # are drawn at once, and are the ones of the trees' column of that year in species_harvest (see Tree.harvest_matrix)
+        at_fruits = Tree.harvest_matrix(AppleTree, tree_n, years=[tree_age])[:, 0]
+
+        # store all tree instances at once, with their (1) idnr, (2) tree string and (3) nr of fruits
+        AppleTree.instances.fill("AppleTree", tree_age, at_fruits, at_cohort["string"])
     
     
     def plot_one_tree(t_string):
@@ -290,19 +1386,19 @@ class AppleTree(Tree):
         
         # for the axiom, a short upright stick is drawn as default
         t.setheading(90)
-        t.forward(random.randrange(10,90))
+        t.forward(random.randrange(*AppleTree.trunk_length))
 
         for c in t_string:
             if c == "0":
-                t.color("red")
-                t.forward(random.randrange(20,140))
+                t.color(AppleTree.colors["0"])
+                t.forward(random.randrange(*AppleTree.segment_lengths["0"]))
             elif c == "1":
-                t.color("brown")
-                t.forward(random.randrange(5,60))
+                t.color(AppleTree.colors["1"])
+                t.forward(random.randrange(*AppleTree.segment_lengths["1"]))
             elif c == "[":
                 locations.append( ( t.pos(),t.heading() ) ) # push position and heading angle
                 t.left(AppleTree.apple_form)
-                t.color("brown")
+                t.color(AppleTree.colors["1"])
             elif c == "]":
                 # move to the last location's stored and retake the same heading angle,
                 # without drawing while moving
@@ -347,19 +1443,26 @@ class PearTree(Tree):
     constants = ["[","]"]                       # a list because it's mutable
     variables = ["0","1"]
     rules = {"1":"11", "0":"1[0]10"}
-    maturation_threshold = random.uniform(4, 6) # pear trees start to bear fruit 4-6 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    grammar = Grammar(axiom, constants, variables, rules) # the checked and frozen L-system above, used to generate the trees (see Grammar)
+    maturation_range = (4, 6)                   # pear trees start to bear fruit 4-6 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    maturation_threshold = OrchardAttribute("maturation_thresholds") # drawn within maturation_range for each orchard (see Orchard)
     disease_threshold = 9                       # the year number at which a disease starts affecting some tree branches
     disease_severity = 4                        # this number, within the [1,10] range, represents the severity level of the disease
                                                 # it can be an integer or float, the higher it is, the more branches are affected -  highest for apples, then plums, then pairs based on literature (https://ptes.org/campaigns/traditional-orchard-project/orchard-practical-guides/fruit-tree-health/orchard-fruit-tree-diseases/)
-    pear_form = random.randrange(30,35)        # determine the form of the pear tree based off literature (https://www.ehow.com/facts_7173569_difference-between-apple-pear-tree.html)
+    form_range = (30, 35)                       # determine the form of the pear tree based off literature (https://www.ehow.com/facts_7173569_difference-between-apple-pear-tree.html)
+    pear_form = OrchardAttribute("forms")       # drawn within form_range for each orchard (see Orchard)
+    harvest_range = (237, 474)                  # the range of pears harvested per year on one mature tree, see the literature and computation further below
+    colors = {"0": "green", "1": "brown"}       # drawing colours of the tips ("0") and of the branches ("1")
+    segment_lengths = {"0": (20, 140), "1": (5, 60)} # ranges of the drawing lengths of the tips and of the branches
+    trunk_length = (50, 130)                    # range of the drawing length of the trunk, the axiom's upright stick
     
-    # the "instances" list below keeps track of all instances that will be generated
-    instances = []
+    # the "instances" store below keeps track of all instances that will be generated
+    instances = TreeStore()
     
     
     def __init__(self, idnr, string, fruits=None):
         """This initializes any instance of a PearTree, namely, we define the
-        attributes of each specific and unique pear tree; It also registers it in the "instances" list"""
+        attributes of each specific and unique pear tree; It also registers it in the "instances" store"""
         self.id = idnr
         self.string = string
         self.fruits = fruits
@@ -367,7 +1470,7 @@ class PearTree(Tree):
        
     
     def __str__(self):
-        return "PearTree nr.: "+ str(self.id) +" with tree string: "+ self.string + "and nr. of fruits: "+ str(self.fruits)
+        return "PearTree nr.: "+ str(self.id) +" with tree string: "+ str(self.string) + "and nr. of fruits: "+ str(self.fruits)
     
  
     # (https://homeguides.sfgate.com/long-grow-pears-79479.html#:~:text=Time%20Frame&text=Once%20pear%20trees%20become%20established,for%2075%20years%20or%20longer.)
@@ -387,22 +1490,24 @@ class PearTree(Tree):
     # conversely, if one and one only pear were present at each tip, as the tree grows over time, pears would increase exponentially and more unrealistically
     
     
-    def pears_per_year(year, t_string):
-        """calculate how many pears per year are generated on a single tree over the given time line"""
+    def pears_per_year(year, t_string=None):
+        """calculate how many pears per year are generated on a single tree over the given time line
+        t_string: the tree string at that year; if it is not given, the branches are counted from the PearTree rules
+        (see Tree.symbol_counts) without generating the string"""
 
         if year < PearTree.maturation_threshold:
             harvest = 0
 
         else:
-            harvest = random.randint(237,474)
+            harvest = random.randint(*PearTree.harvest_range)
             
             #count the number of branches (where we define a branch as a part of the tree that starts from the first bifurcation
             #and terminate in its own unique tip). This definition is operational rather than conceptual, because it allows to 
             #univoquely identify each branch by their unique tip, which is characterized by a "0" in the tree string.
-            branch_count = 0
-            for c in t_string:
-                if c =="0":
-                    branch_count += 1
+            if t_string is None:
+                branch_count = Tree.grammar_counts(PearTree.grammar, year).get("0", 0)
+            else:
+                branch_count = Tree.count_branches(t_string)
             avg_harvest_per_branch = round(harvest/branch_count)
             
             if year >= PearTree.disease_threshold:
@@ -416,21 +1521,21 @@ class PearTree(Tree):
         """This function generates multiple pear tree instances of a desired age.
         tree_n: number of pear tree instances to generate
         tree_age: age of each pear tree instance generated
-        pear tree variable names: at0, at1, ..., atN where N = tree_n-1"""
+        the pear trees are stored in PearTree.instances (a TreeStore), with ids 0, 1, ..., N where N = tree_n-1"""
         
-        # empty the Pear Tree instances list from possible previous instantiations
-        PearTree.instances = []
+        # empty the Pear Tree instances store from possible previous instantiations
+        PearTree.instances.clear()
 
-        for i in range(tree_n):
-            # generate each tree's string, at the specified age
-            at_string = Tree.tree_string(PearTree.axiom, PearTree.constants, PearTree.variables, PearTree.rules, tree_age)             
-            
-            # calculate for each tree, the number of pears it has, at the specified age
-            at_fruits = PearTree.pears_per_year(tree_age, at_string)
-            
-            # generate each tree instance with their (1) idnr, (2) tree string and (3) nr of fruits, and store it in a variable 
-            # note: their names will be at0, at1, ..., atN where N is the specified tree_n-1
-            globals()["at" + str(i)] = PearTree(i, at_string, at_fruits)
+        # the string, branch count and disease effect are the same for all trees of that age, so they are computed once
+        # (see Tree.cohort): the string is a rope shared by all trees of that age, so no tree holds its own copy of it
+        at_cohort = Tree.cohort(PearTree, tree_age)
+
+        # calculate for each tree, the number of pears it has, at the specified age: the harvests of all trees
+        # are drawn at once, and are the ones of the trees' column of that year in species_harvest (see Tree.harvest_matrix)
+        at_fruits = Tree.harvest_matrix(PearTree, tree_n, years=[tree_age])[:, 0]
+
+        # store all tree instances at once, with their (1) idnr, (2) tree string and (3) nr of fruits
+        PearTree.instances.fill("PearTree", tree_age, at_fruits, at_cohort["string"])
     
     
     def plot_one_tree(t_string):
@@ -440,19 +1545,19 @@ class PearTree(Tree):
         
         # for the axiom, a short upright stick is drawn as default
         t.setheading(90)
-        t.forward(random.randrange(50,130))
+        t.forward(random.randrange(*PearTree.trunk_length))
 
         for c in t_string:
             if c == "0":
-                t.color("green")
-                t.forward(random.randrange(20,140))
+                t.color(PearTree.colors["0"])
+                t.forward(random.randrange(*PearTree.segment_lengths["0"]))
             elif c == "1":
-                t.color("brown")
-                t.forward(random.randrange(5,60))
+                t.color(PearTree.colors["1"])
+                t.forward(random.randrange(*PearTree.segment_lengths["1"]))
             elif c == "[":
                 locations.append( ( t.pos(),t.heading() ) ) # push position and heading angle
                 t.left(PearTree.pear_form)
-                t.color("brown")
+                t.color(PearTree.colors["1"])
             elif c == "]":
                 # move to the last location's stored and retake the same heading angle,
                 # without drawing while moving
@@ -498,19 +1603,26 @@ class PlumTree(Tree):
     constants = ["[","]"]                       # a list because it's mutable
     variables = ["0","1"]
     rules = {"1":"11", "0":"1[0][0]0"}
-    maturation_threshold = random.uniform(3, 5) # plum trees start to bear fruit 3-5 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    grammar = Grammar(axiom, constants, variables, rules) # the checked and frozen L-system above, used to generate the trees (see Grammar)
+    maturation_range = (3, 5)                   # plum trees start to bear fruit 3-5 years after planting (https://hortnews.extension.iastate.edu/faq/how-soon-will-newly-planted-fruit-tree-begin-bear-fruit#:~:text=Rootstocks%20have%20little%20effect%20on,plum%20%2D%203%20to%205%20years.)
+    maturation_threshold = OrchardAttribute("maturation_thresholds") # drawn within maturation_range for each orchard (see Orchard)
     disease_threshold = 9                       # the year number at which a disease starts affecting some tree branches
     disease_severity = 5                        # this number, within the [1,10] range, represents the severity level of the disease
                                                 # it can be an integer or float, the higher it is, the more branches are affected -  highest for apples, then plums, then pairs based on literature (https://ptes.org/campaigns/traditional-orchard-project/orchard-practical-guides/fruit-tree-health/orchard-fruit-tree-diseases/)
-    plum_form = random.randrange(20,30)        # determine the form of the plum tree based off literature (https://www.starkbros.com/growing-guide/article/fruit-tree-sizes)
+    form_range = (20, 30)                       # determine the form of the plum tree based off literature (https://www.starkbros.com/growing-guide/article/fruit-tree-sizes)
+    plum_form = OrchardAttribute("forms")       # drawn within form_range for each orchard (see Orchard)
+    harvest_range = (302, 604)                  # the range of plums harvested per year on one mature tree, see the literature and computation further below
+    colors = {"0": "purple", "1": "brown"}      # drawing colours of the tips ("0") and of the branches ("1")
+    segment_lengths = {"0": (10, 100), "1": (10, 70)} # ranges of the drawing lengths of the tips and of the branches
+    trunk_length = (30, 100)                    # range of the drawing length of the trunk, the axiom's upright stick
     
-    # the "instances" list below keeps track of all instances that will be generated
-    instances = []
+    # the "instances" store below keeps track of all instances that will be generated
+    instances = TreeStore()
     
     
     def __init__(self, idnr, string, fruits=None):
         """This initializes any instance of a PlumrTree, namely, we define the
-        attributes of each specific and unique plum tree; It also registers it in the "instances" list"""
+        attributes of each specific and unique plum tree; It also registers it in the "instances" store"""
         self.id = idnr
         self.string = string
         self.fruits = fruits
@@ -518,7 +1630,7 @@ class PlumTree(Tree):
        
     
     def __str__(self):
-        return "PlumTree nr.: "+ str(self.id) +" with tree string: "+ self.string + "and nr. of fruits: "+ str(self.fruits)
+        return "PlumTree nr.: "+ str(self.id) +" with tree string: "+ str(self.string) + "and nr. of fruits: "+ str(self.fruits)
     
     
     # (https://greenupside.com/when-does-a-plum-tree-produce-fruit/) harvest once per year;  kgs of plum per year
@@ -538,22 +1650,24 @@ class PlumTree(Tree):
     # conversely, if one and one only plum were present at each tip, as the tree grows over time, plums would increase exponentially and more unrealistically.
     
     
-    def plums_per_year(year, t_string):
-        """calculate how many plums per year are generated on a single tree over the given time line"""
+    def plums_per_year(year, t_string=None):
+        """calculate how many plums per year are generated on a single tree over the given time line
+        t_string: the tree string at that year; if it is not given, the branches are counted from the PlumTree rules
+        (see Tree.symbol_counts) without generating the string"""
 
         if year < PlumTree.maturation_threshold:
             harvest = 0
 
         else:
-            harvest = random.randint(302,604)
+            harvest = random.randint(*PlumTree.harvest_range)
             
             # count the number of branches (where we define a branch as a part of the tree that starts from the first bifurcation
             # and terminate in its own unique tip). This definition is operational rather than conceptual, because it allows to 
             # univoquely identify each branch by their unique tip, which is characterized by a "0" in the tree string.
-            branch_count = 0
-            for c in t_string:
-                if c =="0":
-                    branch_count += 1
+            if t_string is None:
+                branch_count = Tree.grammar_counts(PlumTree.grammar, year).get("0", 0)
+            else:
+                branch_count = Tree.count_branches(t_string)
             avg_harvest_per_branch = round(harvest/branch_count)
             
             if year >= PlumTree.disease_threshold:
@@ -567,21 +1681,21 @@ class PlumTree(Tree):
         """This function generates multiple plum tree instances of a desired age.
         tree_n: number of plum tree instances to generate
         tree_age: age of each plum tree instance generated
-        plum tree variable names: at0, at1, ..., atN where N = tree_n-1"""
+        the plum trees are stored in PlumTree.instances (a TreeStore), with ids 0, 1, ..., N where N = tree_n-1"""
         
-        # empty the Plum Tree instances list from possible previous instantiations
-        PlumTree.instances = []
+        # empty the Plum Tree instances store from possible previous instantiations
+        PlumTree.instances.clear()
 
-        for i in range(tree_n):
-            # generate each tree's string, at the specified age
-            at_string = Tree.tree_string(PlumTree.axiom, PlumTree.constants, PlumTree.variables, PlumTree.rules, tree_age)             
-            
-            # calculate for each tree, the number of plums it has, at the specified age
-            at_fruits = PlumTree.plums_per_year(tree_age, at_string)
-            
-            # generate each tree instance with their (1) idnr, (2) tree string and (3) nr of fruits, and store it in a variable 
-            # note: their names will be at0, at1, ..., atN where N is the specified tree_n-1
-            globals()["at" + str(i)] = PlumTree(i, at_string, at_fruits)
+        # the string, branch count and disease effect are the same for all trees of that age, so they are computed once
+        # (see Tree.cohort): the string is a rope shared by all trees of that age, so no tree holds its own copy of it
+        at_cohort = Tree.cohort(PlumTree, tree_age)
+
+        # calculate for each tree, the number of plums it has, at the specified age: the harvests of all trees
+        # are drawn at once, and are the ones of the trees' column of that year in species_harvest (see Tree.harvest_matrix)
+        at_fruits = Tree.harvest_matrix(PlumTree, tree_n, years=[tree_age])[:, 0]
+
+        # store all tree instances at once, with their (1) idnr, (2) tree string and (3) nr of fruits
+        PlumTree.instances.fill("PlumTree", tree_age, at_fruits, at_cohort["string"])
     
     
     def plot_one_tree(t_string):
@@ -591,19 +1705,19 @@ class PlumTree(Tree):
         
         # for the axiom, a short upright stick is drawn as default
         t.setheading(90)
-        t.forward(random.randrange(30,100))
+        t.forward(random.randrange(*PlumTree.trunk_length))
 
         for c in t_string:
             if c == "0":
-                t.color("purple")
-                t.forward(random.randrange(10,100)) #20,140
+                t.color(PlumTree.colors["0"])
+                t.forward(random.randrange(*PlumTree.segment_lengths["0"])) #20,140
             elif c == "1":
-                t.color("brown")
-                t.forward(random.randrange(10,70)) #5,60
+                t.color(PlumTree.colors["1"])
+                t.forward(random.randrange(*PlumTree.segment_lengths["1"])) #5,60
             elif c == "[":
                 locations.append( ( t.pos(),t.heading() ) ) # push position and heading angle
                 t.left(PlumTree.plum_form)
-                t.color("brown")
+                t.color(PlumTree.colors["1"])
             elif c == "]":
                 # move to the last location's stored and retake the same heading angle,
                 # without drawing while moving
@@ -650,7 +1764,54 @@ def print_model(coef):
 
 def plot_poly(ax, x, coef):
     x_ = np.linspace(min(x), max(x), 100)
-    y_ = np.zeros(len(x_))
-    for i, c in enumerate(coef):
-        y_ += c * x_**i
-    ax.plot(x_, y_)
\ No newline at end of file
+    # coef can also hold the coefficients of many polynomials, one per row: all of them are plotted
+    y_ = eval_polys(x_, coef)
+    ax.plot(x_, y_.T)
+
+
+
+# batched fitting of polynomial models: many curves (e.g. the yearly harvest of thousands of replicate runs) are fitted
+# at once, with coefficients in the same order as above (coef[i] multiplies x**i)
+
+def vandermonde(x, degree):
+    """This function returns the Vandermonde matrix of the points x: one row per point, with columns 1, x, x**2, ..., x**degree"""
+    return np.vander(np.asarray(x, dtype=float), degree + 1, increasing=True)
+
+
+def fit_polys(x, y, degree):
+    """This function fits a polynomial model of the given degree to each curve of y, by least squares.
+    All curves share the points x, hence one Vandermonde matrix: they are solved together, as one stacked least squares problem.
+    y: an array with one curve per row (and one column per point of x), or a single curve
+    It returns the coefficients, one row per curve (a single vector for a single curve)"""
+    y = np.asarray(y, dtype=float)
+    coef = np.linalg.lstsq(vandermonde(x, degree), y.T, rcond=None)[0]
+    return coef.T
+
+
+def eval_polys(x, coef):
+    """This function evaluates polynomials (one coefficient vector, or one per row) at the points x, all at once, with
+    Horner's scheme. It returns one value per point, or one row of values per polynomial"""
+    coef = np.asarray(coef, dtype=float)
+    x = np.asarray(x, dtype=float)
+    y = np.zeros(coef.shape[:-1] + x.shape)
+    for c in np.moveaxis(coef, -1, 0)[::-1]:
+        y = y * x + np.asarray(c)[..., None]
+    return y
+
+
+def harvest_curves(harvests):
+    """This function stacks the yearly total harvests of many species_harvest dataframes (e.g. of replicate runs) into
+    one array, with one row per dataframe and one column per year of the time line"""
+    columns = [Tree.iterate_years(year_n) for year_n in range(len(Tree.time_line))]
+    return np.stack([harvest_df[columns].to_numpy().sum(axis=0) for harvest_df in harvests])
+
+
+def fit_harvest_curves(harvests, degree):
+    """This function fits a yield-over-year polynomial model of the given degree to many harvests at once.
+    harvests: a list of species_harvest dataframes, or an array of yearly totals with one row per run (e.g. the
+    yearly_totals of an ensemble, see orchard_ensemble.run_ensemble)
+    It returns the coefficients, one row per run (see fit_polys)"""
+    if isinstance(harvests, (list, tuple)) and isinstance(harvests[0], pd.DataFrame):
+        harvests = harvest_curves(harvests)
+    harvests = np.asarray(harvests)
+    return fit_polys(np.arange(harvests.shape[-1]), harvests, degree)
\ No newline at end of file
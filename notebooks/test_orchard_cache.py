@@ -0,0 +1,32 @@
+# tests of the on-disk result cache (see orchard_cache)
+# run from the notebooks folder with: python -m pytest -q
+import os
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import PearTree
+import orchard_cache
+
+
+
+def test_cached_harvest_equals_species_harvest(tmp_path):
+    orchard = Orchard(50, seed=3)
+    cache = orchard_cache.enable(str(tmp_path))
+    try:
+        computed = Tree.species_harvest("PearTree", orchard=orchard)
+        read = Tree.species_harvest("PearTree", orchard=orchard)
+    finally:
+        orchard_cache.disable()
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 1
+    assert read.equals(computed)
+    assert read.equals(Tree.species_harvest("PearTree", orchard=orchard))
+
+
+def test_clear_leaves_files_being_written(tmp_path):
+    cache = orchard_cache.DiskCache(str(tmp_path))
+    cache.tree_string(PearTree.grammar, 3)
+    writing = tmp_path / "ab" / ".tmp-writing.npy"
+    writing.parent.mkdir(exist_ok=True)
+    writing.write_bytes(b"partial")
+    cache.clear()
+    assert [name for root, directories, names in os.walk(tmp_path) for name in names] == [".tmp-writing.npy"]
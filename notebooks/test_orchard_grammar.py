@@ -0,0 +1,38 @@
+# tests of the rewriting of tree strings by a Grammar (see Grammar.rewrite and Tree.compile_rules)
+# run from the notebooks folder with: python -m pytest -q
+import pytest
+
+from orchardproject import Tree
+from orchardproject import AppleTree
+
+
+
+def legacy_string(axiom, rules, years):
+    """the tree string of the original code: each character replaced by the output of its rule, one year at a time"""
+    t_string = axiom
+    for year in range(years):
+        t_string = "".join(rules[c] for c in t_string)
+    return t_string
+
+
+def test_species_strings():
+    for years in range(8):
+        assert Tree.grammar_string(AppleTree.grammar, years) == legacy_string(AppleTree.axiom, AppleTree.grammar.rules, years)
+
+
+def test_erasing_rules():
+    assert Tree.tree_string("0", [], ["0", "1"], {"0": "10", "1": ""}, 3) == "10"
+    assert Tree.ith_iteration("0110", [], ["0", "1"], {"0": "", "1": ""}) == ""
+
+
+@pytest.mark.parametrize("start", ["0X1", "0é"])
+def test_symbols_without_rule(start):
+    with pytest.raises(KeyError):
+        Tree.ith_iteration(start, AppleTree.constants, AppleTree.variables, AppleTree.rules)
+
+
+def test_cached_grammar():
+    grammar = Tree.cached_grammar(AppleTree.axiom, AppleTree.constants, AppleTree.variables, AppleTree.rules)
+    assert grammar == AppleTree.grammar
+    assert grammar is Tree.cached_grammar(AppleTree.axiom, AppleTree.constants, AppleTree.variables, dict(AppleTree.rules))
+    assert AppleTree.cached_grammar(AppleTree.axiom, AppleTree.constants, AppleTree.variables, AppleTree.rules) is grammar
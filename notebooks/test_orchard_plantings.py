@@ -0,0 +1,77 @@
+# regression tests of mixed-age plantings (see Orchard.add_planting): every species is harvested on its own planting
+# schedule, checked against a harvest matrix computed by hand, cell by cell, from the harvest draws and the cohorts
+# run from the notebooks folder with: python -m pytest -q
+import numpy as np
+import pytest
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import TreeStore
+from orchardproject import AppleTree
+
+
+
+def planted_orchard():
+    """an orchard with one extra planting of each species: during the time line, late in it, and after it"""
+    orchard = Orchard(20, seed=11)
+    orchard.add_planting("AppleTree", 20, 2)
+    orchard.add_planting("PearTree", 5, 3)
+    orchard.add_planting("PlumTree", 8, 10)
+    return orchard
+
+
+def hand_harvest(orchard, species):
+    """the harvest matrix of a species, one tree and one year at a time: trees bear nothing before their planting year
+    nor before maturity, then their draw minus the fruits of the branches affected by the disease at their age"""
+    species_class = Tree.species_class(species)
+    harvest = []
+    tree_id = 0
+    for planting_year, n_trees in orchard.plantings[species]:
+        for i in range(n_trees):
+            row = []
+            for year in range(len(Tree.time_line)):
+                age = year - planting_year
+                if age < orchard.maturation_thresholds[species]:
+                    row.append(0)
+                    continue
+                draw = int(Tree.harvest_draws(species_class, orchard.seed, tree_id, year))
+                cohort = Tree.cohort(species_class, age)
+                row.append(draw - cohort["n_affected_branches"] * round(draw / cohort["harvest_divisor"]))
+            harvest.append(row)
+            tree_id += 1
+    return np.array(harvest, dtype=np.int64)
+
+
+@pytest.mark.parametrize("species", TreeStore.species_names)
+def test_harvest_follows_the_species_plantings(species):
+    orchard = planted_orchard()
+    harvest = Tree.species_harvest(species, orchard=orchard)
+    assert len(harvest) == orchard.tree_counts[species]
+    assert (harvest.drop(columns="Total").values == hand_harvest(orchard, species)).all()
+
+
+def test_plantings_of_other_species_do_not_change_a_harvest():
+    orchard = Orchard(20, seed=11)
+    apples = Tree.species_harvest("AppleTree", orchard=orchard)
+    orchard.add_planting("PlumTree", 8, 10)
+    orchard.add_planting("PearTree", 5, 3)
+    assert Tree.species_harvest("AppleTree", orchard=orchard).equals(apples)
+
+
+def test_late_plantings_bear_no_fruit():
+    orchard = planted_orchard()
+    # apple trees planted after the time line never bear fruit
+    apples = Tree.species_harvest("AppleTree", orchard=orchard)
+    assert (apples.iloc[-2:].values == 0).all()
+    # pear trees planted in year 5 bear nothing before they are mature
+    pears = Tree.species_harvest("PearTree", orchard=orchard).drop(columns="Total").values
+    first_harvest = 5 + int(np.ceil(orchard.maturation_thresholds["PearTree"]))
+    assert (pears[-3:, :first_harvest] == 0).all()
+    assert (pears[-3:, first_harvest:] > 0).all()
+
+
+def test_species_class():
+    assert Tree.species_class("AppleTree") is AppleTree
+    assert Tree.species_class(AppleTree) is AppleTree
+    with pytest.raises(ValueError):
+        Tree.species_class("apple")
@@ -0,0 +1,77 @@
+# tests of the headless rendering (see orchard_render): the array interpretation of tree strings draws the segments
+# of turtle's plot_one_tree, for whole trees, for slices of them (with branches left open) and for memory-mapped strings
+# run from the notebooks folder with: python -m pytest -q
+import numpy as np
+import pytest
+
+from orchardproject import Tree
+from orchardproject import PlumTree
+import orchard_render
+
+
+
+def turtle_segments(t_string, lengths, form):
+    """the segments drawn by plot_one_tree (without its trunk), one character at a time, with the given segment lengths"""
+    position, heading = np.zeros(2), 90.0
+    locations = []
+    starts, ends = [], []
+    segment_n = 0
+    for c in t_string:
+        if c in "01":
+            end = position + lengths[segment_n] * np.array([np.cos(np.radians(heading)), np.sin(np.radians(heading))])
+            starts.append(position)
+            ends.append(end)
+            position = end
+            segment_n += 1
+        elif c == "[":
+            locations.append((position, heading))
+            heading += form
+        elif c == "]":
+            position, heading = locations.pop()
+            heading -= form
+    return np.array(starts).reshape(-1, 2), np.array(ends).reshape(-1, 2)
+
+
+def array_segments(t_string, lengths, form):
+    skeleton = orchard_render.interpret(orchard_render.symbol_codes(t_string), form)
+    return orchard_render.place(skeleton, lengths)
+
+
+@pytest.mark.parametrize("t_string", ["1[0]0", "1[0", "1[0]0[1", "1[1[0", "11[[0]0", "",
+                                      Tree.grammar_string(PlumTree.grammar, 4)[:37]])
+def test_interpret_draws_like_turtle(t_string):
+    lengths = np.arange(1, t_string.count("0") + t_string.count("1") + 1)
+    for starts, expected in zip(array_segments(t_string, lengths, 25), turtle_segments(t_string, lengths, 25)):
+        assert np.allclose(starts, expected)
+
+
+def test_prefixes_of_a_tree_string():
+    t_string = Tree.grammar_string(PlumTree.grammar, 5)
+    lengths = np.arange(1, t_string.count("0") + t_string.count("1") + 1)
+    for stop in range(0, 300, 7):
+        prefix = t_string[:stop]
+        n_segments = prefix.count("0") + prefix.count("1")
+        for starts, expected in zip(array_segments(prefix, lengths[:n_segments], 20), turtle_segments(prefix, lengths, 20)):
+            assert np.allclose(starts, expected)
+
+
+def test_unmatched_close_raises():
+    with pytest.raises(ValueError):
+        orchard_render.interpret(orchard_render.symbol_codes("1]0"), 25)
+
+
+def test_render_a_slice_of_a_mapped_string(tmp_path):
+    mapped = Tree.mapped_string(PlumTree.grammar, 6, directory=str(tmp_path))
+    path = tmp_path / "plum.png"
+    orchard_render.render_tree(str(path), "PlumTree", mapped[0:200], rng=np.random.default_rng(0))
+    assert path.read_bytes().startswith(b"\x89PNG")
+
+
+def test_mapped_slices_draw_like_strings(tmp_path):
+    mapped = Tree.mapped_string(PlumTree.grammar, 6, directory=str(tmp_path))
+    t_string = Tree.grammar_string(PlumTree.grammar, 6)
+    lengths = np.arange(1, len(t_string) + 1)
+    for stop in (1, 50, 200, 1000):
+        n_segments = t_string[:stop].count("0") + t_string[:stop].count("1")
+        for starts, expected in zip(array_segments(mapped[0:stop], lengths[:n_segments], 25), turtle_segments(t_string[:stop], lengths, 25)):
+            assert np.allclose(starts, expected)
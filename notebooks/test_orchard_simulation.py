@@ -0,0 +1,53 @@
+# tests of the year-stepping simulation (see orchard_simulation): stepped over the whole time line, with a planting of
+# each species, it gives the harvest of species_harvest
+# run from the notebooks folder with: python -m pytest -q
+import numpy as np
+import pytest
+
+from orchardproject import Orchard
+from orchardproject import Tree
+from orchardproject import TreeStore
+from orchard_simulation import OrchardSimulation
+
+
+
+def planted_orchard():
+    """an orchard with one extra planting of each species, in different years"""
+    orchard = Orchard(20, seed=5)
+    orchard.add_planting("AppleTree", 10, 4)
+    orchard.add_planting("PearTree", 3, 2)
+    orchard.add_planting("PlumTree", 8, 10)
+    return orchard
+
+
+# the year and number of trees of the extra planting of each species
+extra_plantings = {"AppleTree": (10, 4), "PearTree": (3, 2), "PlumTree": (8, 10)}
+
+
+@pytest.mark.parametrize("species", TreeStore.species_names)
+def test_simulation_equals_species_harvest(species):
+    orchard = planted_orchard()
+    simulation = OrchardSimulation(orchard).run()
+    assert simulation.harvest(species).equals(Tree.species_harvest(species, orchard=orchard))
+    assert (simulation.yearly_totals(species) == Tree.yearly_totals(species, orchard=orchard)).all()
+
+
+@pytest.mark.parametrize("species", TreeStore.species_names)
+def test_cohorts_bear_fruit_once_mature(species):
+    orchard = planted_orchard()
+    harvest = OrchardSimulation(orchard).run().harvest(species).drop(columns="Total").values
+    planting_year, n_trees = extra_plantings[species]
+    first_harvest = planting_year + int(np.ceil(orchard.maturation_thresholds[species]))
+    assert (harvest[-n_trees:, :first_harvest] == 0).all()
+    assert (harvest[-n_trees:, first_harvest:] > 0).all()
+    # the trees planted in year 0 bear fruit from their maturity on
+    assert (harvest[:-n_trees, int(np.ceil(orchard.maturation_thresholds[species])):] > 0).all()
+
+
+def test_plantings_after_the_time_line():
+    orchard = planted_orchard()
+    orchard.add_planting("PlumTree", 20, 2)
+    plums = OrchardSimulation(orchard).run().harvest("PlumTree")
+    assert len(plums) == orchard.tree_counts["PlumTree"]
+    assert (plums.iloc[-2:].values == 0).all()
+    assert plums.equals(Tree.species_harvest("PlumTree", orchard=orchard))